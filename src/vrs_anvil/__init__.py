@@ -1,13 +1,17 @@
+import gzip
 import json
 import logging
 import os
+import re
 import subprocess
-from typing import Optional, Generator, Any
+import threading
+from collections import OrderedDict
+from typing import Optional, Generator, Any, Literal
 import zipfile
 
 import psutil
 from biocommons.seqrepo import SeqRepo
-from diskcache import Cache
+from diskcache import Cache, FanoutCache
 from ga4gh.vrs import models as VRS
 from ga4gh.vrs.dataproxy import SeqRepoDataProxy
 from ga4gh.vrs.extras.translator import AlleleTranslator
@@ -17,6 +21,8 @@ from pydantic import BaseModel, model_validator
 import requests
 import yaml
 
+from vrs_anvil import timing
+
 
 _logger = logging.getLogger("vrs_anvil")
 LOGGED_ALREADY = set()
@@ -25,10 +31,7 @@ METAKB_API = "https://dev-search.cancervariants.org/api/v2"
 
 manifest: "Manifest" = None
 
-# TODO - read from manifest
-gigabytes = 20
 bytes_in_a_gigabyte = 1024**3  # 1 gigabyte = 1024^3 bytes
-cache_size_limit = gigabytes * bytes_in_a_gigabyte
 
 
 def seqrepo_dir():
@@ -47,41 +50,292 @@ def get_cache_directory(cache_dir: str, cache_name: str) -> str:
     return str(Path(cache_dir) / cache_name)
 
 
+class MemoryCache:
+    """A bounded, thread safe, least recently used in-memory cache with hit/miss/eviction counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the value for key, marking it most recently used."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store the value for key, evicting the least recently used entry when full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Return the tier's counters."""
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TieredCache:
+    """An in-memory LRU tier in front of a diskcache tier, shared by all translators in a process."""
+
+    # the disk tier is culled by us every CULL_INTERVAL writes, so evictions can be counted
+    CULL_INTERVAL = 1000
+
+    def __init__(self, disk: Cache | FanoutCache, memory_size: int):
+        self.memory = MemoryCache(memory_size)
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.disk_hits = self.disk_misses = self.disk_writes = self.disk_evictions = 0
+
+    def get(self, key, default=None):
+        """Single lookup per tier, promoting disk hits into memory."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key)
+        with self._lock:
+            if value is None:
+                self.disk_misses += 1
+                return default
+            self.disk_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """Write through both tiers."""
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+        with self._lock:
+            self.disk_writes += 1
+            cull = self.disk_writes % self.CULL_INTERVAL == 0
+        if cull:
+            evicted = self.disk.cull()
+            with self._lock:
+                self.disk_evictions += evicted
+
+    def stats(self) -> dict:
+        """Return the counters for each tier."""
+        return {
+            "memory": self.memory.stats(),
+            "disk": {
+                "hits": self.disk_hits,
+                "misses": self.disk_misses,
+                "writes": self.disk_writes,
+                "evictions": self.disk_evictions,
+            },
+        }
+
+
+# one TieredCache per cache directory, see allele_translator_cache
+_allele_translator_caches: dict[str, TieredCache] = {}
+_allele_translator_caches_lock = threading.Lock()
+
+
+def allele_translator_disk_cache(_manifest: "Manifest") -> Cache | FanoutCache:
+    """Open the allele translator disk cache with the manifest's size, backend and eviction policy."""
+    directory = get_cache_directory(_manifest.cache_directory, "allele_translator")
+    settings = {
+        "size_limit": int(_manifest.cache_size_gb * bytes_in_a_gigabyte),
+        "eviction_policy": _manifest.cache_eviction_policy,
+        "cull_limit": 0,  # culled by TieredCache
+    }
+    if _manifest.cache_backend == "fanout":
+        # size_limit is split evenly across the shards, each shard is its own sqlite file
+        return FanoutCache(
+            directory=directory, shards=_manifest.cache_shards, **settings
+        )
+    return Cache(directory=directory, **settings)
+
+
+def allele_translator_cache(_manifest: "Manifest") -> TieredCache:
+    """Return the process wide allele translator cache for the manifest's cache directory."""
+    directory = get_cache_directory(_manifest.cache_directory, "allele_translator")
+    with _allele_translator_caches_lock:
+        if directory not in _allele_translator_caches:
+            disk = allele_translator_disk_cache(_manifest)
+            _allele_translator_caches[directory] = TieredCache(
+                disk, _manifest.memory_cache_size
+            )
+        return _allele_translator_caches[directory]
+
+
+def export_allele_translator_cache(_manifest: "Manifest", path: str) -> int:
+    """Write the cached gnomAD expression -> VRS id pairs to a gzipped, sorted, tab separated file, return the count."""
+    disk = allele_translator_disk_cache(_manifest)
+    suffix = "-gnomad"
+    keys = sorted(key for key in disk if isinstance(key, str) and key.endswith(suffix))
+    count = 0
+    with gzip.open(path, "wt") as f:
+        for key in keys:
+            vrs_id = disk.get(key)
+            if vrs_id is None:  # evicted since we listed the keys
+                continue
+            f.write(f"{key[:-len(suffix)]}\t{vrs_id}\n")
+            count += 1
+    disk.close()
+    return count
+
+
+def import_allele_translator_cache(_manifest: "Manifest", path: str) -> int:
+    """Load a file written by export_allele_translator_cache in a single transaction, return the count."""
+    disk = allele_translator_disk_cache(_manifest)
+    count = 0
+    with gzip.open(path, "rt") as f, disk.transact():
+        for line in f:
+            gnomad_expression, vrs_id = line.rstrip("\n").split("\t")
+            disk.set(f"{gnomad_expression}-gnomad", vrs_id)
+            count += 1
+    # automatic culling is disabled, see allele_translator_disk_cache
+    disk.cull()
+    disk.close()
+    return count
+
+
+def sum_cache_stats(stats: list[dict]) -> dict:
+    """Sum a list of {tier: {counter: value}} dicts."""
+    totals = {}
+    for _stats in stats:
+        for tier, counters in _stats.items():
+            for counter, value in counters.items():
+                totals.setdefault(tier, {}).setdefault(counter, 0)
+                totals[tier][counter] += value
+    return totals
+
+
+def diff_cache_stats(stats: dict, since: dict) -> dict:
+    """Return the counters of stats less those of an earlier snapshot, e.g. to report a single run. Sizes are kept as they are."""
+    return {
+        tier: {
+            counter: (
+                value
+                if counter == "size"
+                else value - since.get(tier, {}).get(counter, 0)
+            )
+            for counter, value in counters.items()
+        }
+        for tier, counters in stats.items()
+    }
+
+
+def allele_translator_cache_stats() -> dict:
+    """Sum the tier counters of this process' allele translator caches and lookup tables."""
+    return sum_cache_stats(
+        [cache.stats() for cache in list(_allele_translator_caches.values())]
+        + [
+            {"lookup_table": table.stats()}
+            for table in list(_vrs_lookup_tables.values())
+        ]
+    )
+
+
+# one memory-mapped VRSLookupTable per path, see vrs_lookup_table
+_vrs_lookup_tables: dict[str, Any] = {}
+_vrs_lookup_tables_lock = threading.Lock()
+
+
+def vrs_lookup_table(table_path: str):
+    """Return the process wide VRSLookupTable for the path."""
+    from vrs_anvil.lookup import VRSLookupTable
+
+    with _vrs_lookup_tables_lock:
+        if table_path not in _vrs_lookup_tables:
+            _vrs_lookup_tables[table_path] = VRSLookupTable(table_path)
+            _logger.info(
+                f"Loaded {len(_vrs_lookup_tables[table_path])} VRS ids from {table_path}"
+            )
+        return _vrs_lookup_tables[table_path]
+
+
+class TimedSeqRepoDataProxy(SeqRepoDataProxy):
+    """A SeqRepoDataProxy timing its seqrepo reads as the seqrepo stage, see vrs_anvil.timing."""
+
+    def _get_sequence(self, identifier, start=None, end=None):
+        started = timing.start()
+        try:
+            return super()._get_sequence(identifier, start=start, end=end)
+        finally:
+            timing.stop("seqrepo", started)
+
+    def _get_metadata(self, identifier):
+        started = timing.start()
+        try:
+            return super()._get_metadata(identifier)
+        finally:
+            timing.stop("seqrepo", started)
+
+
 class CachingAlleleTranslator(AlleleTranslator):
     """A subclass of AlleleTranslator that uses cache results and adds a method to run in a threaded fashion."""
 
-    _cache: Cache = None
+    _cache: TieredCache = None
 
     def __init__(self, data_proxy: SeqRepoDataProxy, normalize: bool = False):
         super().__init__(data_proxy)
         self.normalize = normalize
         self._cache = None
+        self._lookup_table = None
         if manifest and manifest.cache_enabled:
-            self._cache = Cache(
-                directory=get_cache_directory(
-                    manifest.cache_directory, "allele_translator"
-                ),
-                size_limit=cache_size_limit,
-            )
+            self._cache = allele_translator_cache(manifest)
         else:
             _logger.info("Cache is not enabled")
+        if manifest and manifest.vrs_lookup_table:
+            self._lookup_table = vrs_lookup_table(manifest.vrs_lookup_table)
 
     def translate_from(self, var, fmt=None, **kwargs):
-        """Check and update cache"""
+        """Check the precomputed lookup table, then check and update cache"""
+
+        if self._lookup_table is not None and fmt == "gnomad":
+            if self.normalize:
+                started = timing.start()
+                allele_id = self._lookup_table.get(var)
+                timing.stop("lookup_table", started)
+                if allele_id is not None:
+                    return allele_id
+            else:
+                # the table holds the normalized ids of VRS annotated VCFs, a hit would differ from a translation
+                _ = "Lookup table ignored, it only holds normalized VRS ids"
+                if _ not in LOGGED_ALREADY:
+                    LOGGED_ALREADY.add(_)
+                    _logger.warning(_)
 
         if self._cache is not None:
             key = f"{var}-{fmt}"
-            if key in self._cache:
-                return self._cache[key]
-
+            started = timing.start()
+            allele_id = self._cache.get(key)
+            timing.stop("cache_get", started)
+            if allele_id is not None:
+                return allele_id
+
+        # parsing, seqrepo reads, normalization and digests, the seqrepo stage times the reads alone
+        started = timing.start()
         allele = super().translate_from(var, fmt=fmt, **kwargs)
+        timing.stop("translate", started)
 
         assert isinstance(
             allele, VRS.Allele
         ), f"Allele is not the expected Pydantic Model {type(allele)}: {allele}"
 
         if self._cache is not None:
-            self._cache[key] = allele.id
+            started = timing.start()
+            self._cache.set(key, allele.id)
+            timing.stop("cache_set", started)
 
         return allele.id
 
@@ -95,20 +349,25 @@ def caching_allele_translator_factory(
             seqrepo_directory = manifest.seqrepo_directory
         else:
             seqrepo_directory = seqrepo_dir()
-    dp = SeqRepoDataProxy(SeqRepo(seqrepo_directory))
+    dp = TimedSeqRepoDataProxy(SeqRepo(seqrepo_directory))
     assert dp is not None, "SeqRepoDataProxy is None"
     translator = CachingAlleleTranslator(dp)
     translator.normalize = normalize
     return translator
 
 
+# TODO - Should this be a config in the manifest?
+# ['<INS>', '<DEL>', '<DUP>', '<INV>', '<CNV>', '<DUP:TANDEM>', '<DUP:INT>', '<DUP:EXT>', '*']
+INVALID_ALT = re.compile(r"INS|DEL|DUP|INV|CNV|TANDEM|INT|EXT|\*")
+
+
 def generate_gnomad_ids(vcf_line, compute_for_ref: bool = True) -> list[str]:
     """Assuming a standard VCF format with tab-separated fields, generate a gnomAD-like ID from a VCF line.
     see https://github.com/ga4gh/vrs-python/blob/main/src/ga4gh/vrs/extras/vcf_annotation.py#L386-L411
     """
-    fields = vcf_line.strip().split("\t")
+    # only CHROM, POS, ID, REF and ALT are needed, leave the (possibly thousands of) sample columns unsplit
+    fields = vcf_line.split("\t", 5)
     gnomad_ids = []
-    # Extract relevant information (you may need to adjust these indices based on your VCF format)
     chromosome = fields[0]
     position = fields[1]
     reference_allele = fields[3]
@@ -120,20 +379,13 @@ def generate_gnomad_ids(vcf_line, compute_for_ref: bool = True) -> list[str]:
     for alt in alternate_allele.split(","):
         alt = alt.strip()
         # TODO - Should we be raising a ValueError hear and let the caller do the logging?
-        # TODO - Should this be a config in the manifest?
-        # ['<INS>', '<DEL>', '<DUP>', '<INV>', '<CNV>', '<DUP:TANDEM>', '<DUP:INT>', '<DUP:EXT>', '*']
-        invalid_alts = ["INS", "DEL", "DUP", "INV", "CNV", "TANDEM", "INT", "EXT", "*"]
-        is_valid = True
-        for invalid_alt in invalid_alts:
-            if invalid_alt in alt:
-                is_valid = False
-                _ = f"Invalid alt found: {alt}"
-                if _ not in LOGGED_ALREADY:
-                    LOGGED_ALREADY.add(_)
-                    _logger.error(_)
-                break
-        if is_valid:
-            gnomad_ids.append(f"{gnomad_loc}-{reference_allele}-{alt}")
+        if INVALID_ALT.search(alt):
+            _ = f"Invalid alt found: {alt}"
+            if _ not in LOGGED_ALREADY:
+                LOGGED_ALREADY.add(_)
+                _logger.error(_)
+            continue
+        gnomad_ids.append(f"{gnomad_loc}-{reference_allele}-{alt}")
 
     return gnomad_ids
 
@@ -256,9 +508,39 @@ class Manifest(BaseModel):
     num_threads: int = 2
     """Number of threads to use for processing, defaults to 2"""
 
-    # TODO: not implemented
+    autotune: bool = False
+    """Before annotating, time translation with several thread, process and threads per process counts on the first variants and use the fastest, see annotate --autotune"""
+
+    autotune_variants: int = 2000
+    """Number of variants translated by each autotune candidate"""
+
+    translation_mode: Literal["thread", "process"] = "thread"
+    """Run the num_threads translation workers as threads or as processes, defaults to thread"""
+
+    threads_per_process: int = 1
+    """Translation threads in each worker process when translation_mode is process, defaults to 1"""
+
+    batch_size: int = 1000
+    """Number of variants shipped to a translation worker per work unit, defaults to 1000"""
+
+    preserve_order: Optional[bool] = False
+    """Return translations in VCF line order rather than completion order, defaults to False"""
+
+    deduplicate: Optional[bool] = False
+    """Translate each distinct chrom-pos-ref-alt once across all files, fanning the VRS id out to every line.
+    Duplicates are returned after the first occurrence, so this overrides preserve_order. Defaults to False"""
+
     annotate_vcfs: bool = False
-    """Should we create new VCFs with annotations. FOR FUTURE USE"""
+    """Write a bgzipped, tabix indexed copy of each vcf with VRS_Allele_IDs to the work directory, requires the text vcf_reader"""
+
+    results_format: Optional[Literal["parquet", "arrow"]] = None
+    """Stream (file, line_number, var, vrs_id, metakb_hit, error) for every allele to state_directory/results_<timestamp>.<format>, defaults to None (off)"""
+
+    results_batch_size: int = 100000
+    """Rows buffered in memory before a record batch is written to the results file"""
+
+    spill_matches: bool = False
+    """Stream MetaKB matches to state_directory/matches_<timestamp>.parquet rather than holding them in memory for the metrics yaml"""
 
     state_directory: str = "state/"
     """where to store the state of the application, log files, etc."""
@@ -267,6 +549,27 @@ class Manifest(BaseModel):
     """The local file paths or URLs to vcf files to be processed"""
     # TODO - 2x check why local files need to be absolute paths
 
+    vcf_reader: Literal["text", "pysam"] = "text"
+    """How to read vcf files: text (python gzip) or pysam (htslib, sites only, skips parsing the sample columns)"""
+
+    decompression_threads: int = 4
+    """Threads inflating the blocks of bgzipped vcf files in parallel, 1 to decompress on the reading thread"""
+
+    regions: Optional[list[str]] = None
+    """Only annotate records whose POS is in these chrom:start[-end] regions of indexed vcf files, set by annotate --scatter --regions"""
+
+    checkpoint_interval: float = 60
+    """Seconds between checkpoints of annotate progress in state_directory, see annotate --resume. 0 disables them"""
+
+    progress_interval: float = 30
+    """Seconds between snapshots of annotate throughput written to state_directory/progress_<timestamp>.yaml for vrs_bulk ps. 0 disables them"""
+
+    timing: bool = False
+    """Record the time spent in each stage of annotate (reading, parsing, translating, seqrepo reads, caching, MetaKB lookups) per worker in the metrics, see annotate --timing"""
+
+    max_scattered_processes: Optional[int] = None
+    """Most annotate --scatter child processes running at once, larger jobs start first. Defaults to the number of cpus"""
+
     work_directory: str = "work/"
     """The directory to store intermediate files"""
 
@@ -282,6 +585,30 @@ class Manifest(BaseModel):
     cache_enabled: Optional[bool] = True
     """Cache results"""
 
+    memory_cache_size: int = 100000
+    """Number of VRS ids held in an in-memory LRU in front of the disk cache, per process. 0 disables it"""
+
+    cache_size_gb: float = 20
+    """Size limit of the allele translator disk cache in gigabytes, defaults to 20"""
+
+    cache_backend: Literal["cache", "fanout"] = "cache"
+    """diskcache backend, a single sqlite file (cache) or sharded across cache_shards files (fanout), defaults to cache"""
+
+    cache_shards: int = 8
+    """Number of shards for the fanout backend, concurrent writers only contend within a shard, defaults to 8"""
+
+    cache_eviction_policy: Literal[
+        "least-recently-stored",
+        "least-recently-used",
+        "least-frequently-used",
+        "none",
+    ] = "least-recently-stored"
+    """diskcache eviction policy once cache_size_gb is reached, defaults to least-recently-stored"""
+
+    vrs_lookup_table: Optional[str] = None
+    """Path to a table built by `vrs_bulk build-lookup` from VRS annotated VCFs, alleles found in it are not translated.
+    The table holds normalized VRS ids, so it is only used when normalize is true"""
+
     compute_for_ref: Optional[bool] = False
     """Compute reference allele"""
 
@@ -306,6 +633,16 @@ class Manifest(BaseModel):
             if not Path(getattr(self, _)).exists():
                 raise ValueError(f"{_} does not exist")
 
+        if self.annotate_vcfs and self.vcf_reader == "pysam":
+            raise ValueError(
+                "annotate_vcfs needs the text vcf_reader, the pysam reader drops all but the first five columns"
+            )
+
+        if self.vrs_lookup_table:
+            self.vrs_lookup_table = str(Path(self.vrs_lookup_table).expanduser())
+            if not Path(self.vrs_lookup_table).exists():
+                raise ValueError("vrs_lookup_table does not exist")
+
         for _ in ["work_directory", "cache_directory", "state_directory"]:
             if not Path(getattr(self, _)).exists():
                 Path(getattr(self, _)).mkdir(parents=True, exist_ok=True)
@@ -1,46 +1,67 @@
 import gzip
+import hashlib
+import itertools
 import logging
 import pathlib
 import time
-from collections import defaultdict
 from datetime import datetime
-from typing import Generator
+from typing import Generator, TextIO
 
-import yaml
 from ga4gh.vrs import models as VRS
+from pysam import TabixFile, VariantFile, VariantRecord
 from tqdm import tqdm
 
 import vrs_anvil
-from vrs_anvil import Manifest, generate_gnomad_ids
+from vrs_anvil import Manifest, diff_cache_stats, generate_gnomad_ids, timing
+from vrs_anvil.autotune import autotune
+from vrs_anvil.bgzf import is_bgzf, open_bgzf
+from vrs_anvil.checkpoint import (
+    ProgressTracker,
+    checkpoint_path,
+    load_checkpoint,
+    write_checkpoint,
+)
 from vrs_anvil.collector import collect_manifest_urls
-from vrs_anvil.translator import Translator, VCFItem
+from vrs_anvil.metrics import (  # noqa: F401 the metrics keys were defined here
+    ANNOTATED_VCF,
+    AUTOTUNE,
+    CACHE,
+    ELAPSED_TIME,
+    END_TIME,
+    ERROR,
+    ERRORS,
+    LINE_COUNT,
+    MATCHES,
+    MATCHES_FILE,
+    MATCHES_SCHEMA,
+    METAKB_HITS,
+    PARAMETERS,
+    REGIONS,
+    RESULTS,
+    START_TIME,
+    STATUS,
+    SUCCESSES,
+    TIMESTAMP,
+    TIMING,
+    TOTAL,
+    VRS_OBJECT,
+    FileMetrics,
+    RunMetrics,
+)
+from vrs_anvil.progress import ProgressReporter
+from vrs_anvil.regions import index_path, parse_region
+from vrs_anvil.results import ResultsSink
+from vrs_anvil.translator import (
+    Translator,
+    VCFItem,
+    cache_stats,
+    reset_stats,
+    timing_stats,
+)
+from vrs_anvil.vcf_writer import AnnotatedVCFWriter
 
 _logger = logging.getLogger("vrs_anvil.annotator")
 
-# enums for metrics
-# TODO: do this for keys across files like "parameters" but also "fmt" and "line"
-PARAMETERS = "parameters"
-TOTAL = "total"
-STATUS = "status"
-SUCCESSES = "successes"
-ERROR = "error"
-METAKB_HITS = "metakb_hits"
-MATCHES = "matches"
-START_TIME = "start_time"
-END_TIME = "end_time"
-ELAPSED_TIME = "elapsed_time"
-LINE_COUNT = "line_count"
-VRS_OBJECT = "vrs_object"
-TIMESTAMP = "timestamp_str"
-
-
-def recursive_defaultdict():
-    """Implicitly create an entry if a key is read that doesn’t yet exist, any level deep"""
-    return defaultdict(recursive_defaultdict)
-
-
-metrics = recursive_defaultdict()
-
 
 def _work_file_generator(manifest: Manifest) -> Generator[pathlib.Path, None, None]:
     """Return a generator for the files in the manifest."""
@@ -50,8 +71,113 @@ def _work_file_generator(manifest: Manifest) -> Generator[pathlib.Path, None, No
         yield work_file
 
 
-def _vcf_item_generator(manifest: Manifest) -> Generator[tuple, None, None]:
-    """Return a VCFItem for each line in the vcf."""
+def _sites_line(record: VariantRecord) -> str:
+    """Return the CHROM POS ID REF ALT columns of a pysam record."""
+    alts = ",".join(record.alts) if record.alts else "."
+    return f"{record.chrom}\t{record.pos}\t.\t{record.ref}\t{alts}"
+
+
+def _vcf_region_lines(
+    work_file: pathlib.Path, manifest: Manifest
+) -> Generator[str, None, None]:
+    """Return the data lines in the manifest's regions of an indexed vcf.
+    Only the region holding a record's POS returns it, so records spanning a region boundary are read once.
+    """
+    _index_path = index_path(work_file)
+    assert _index_path, f"{work_file} needs a .tbi or .csi index to read regions"
+    if manifest.vcf_reader == "pysam":
+        f = VariantFile(
+            str(work_file),
+            index_filename=_index_path,
+            drop_samples=True,
+            threads=manifest.decompression_threads,
+        )
+    else:
+        f = TabixFile(
+            str(work_file),
+            index=_index_path,
+            encoding="utf-8",
+            threads=manifest.decompression_threads,
+        )
+    with f:
+        for region in manifest.regions:
+            contig, start, end = parse_region(region)
+            for record in f.fetch(contig, start - 1, end):
+                if manifest.vcf_reader == "pysam":
+                    if record.pos >= start:
+                        yield _sites_line(record)
+                elif int(record.split("\t", 2)[1]) >= start:
+                    yield record
+
+
+def _vcf_lines(
+    work_file: pathlib.Path, manifest: Manifest
+) -> Generator[str, None, None]:
+    """Return the data lines of a vcf.
+    With the pysam reader, htslib parses the file without its samples and only CHROM POS ID REF ALT are returned.
+    """
+    if manifest.regions:
+        yield from _vcf_region_lines(work_file, manifest)
+        return
+
+    if manifest.vcf_reader == "pysam":
+        with VariantFile(
+            str(work_file), drop_samples=True, threads=manifest.decompression_threads
+        ) as vcf:
+            for record in vcf:
+                yield _sites_line(record)
+        return
+
+    with _open_vcf(work_file, manifest) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            yield line
+
+
+def _open_vcf(work_file: pathlib.Path, manifest: Manifest) -> TextIO:
+    """Open a vcf for reading text."""
+    if manifest.decompression_threads > 1 and is_bgzf(work_file):
+        return open_bgzf(work_file, manifest.decompression_threads)
+    if "gz" in str(work_file):
+        return gzip.open(work_file, "rt")
+    return open(work_file, "r")
+
+
+def _vcf_header(work_file: pathlib.Path, manifest: Manifest) -> list[str]:
+    """Return the header lines of a vcf."""
+    header = []
+    with _open_vcf(work_file, manifest) as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            header.append(line)
+    return header
+
+
+def _annotated_vcf_path(work_file: pathlib.Path, manifest: Manifest) -> pathlib.Path:
+    """Return where the VRS annotated copy of a vcf is written, region shards get their own file."""
+    stem = work_file.name.removesuffix(".gz").removesuffix(".bgz").removesuffix(".vcf")
+    if manifest.regions:
+        digest = hashlib.sha256(",".join(manifest.regions).encode()).hexdigest()
+        stem += f".{digest[:8]}"
+    return pathlib.Path(manifest.work_directory) / f"{stem}.vrs.vcf.gz"
+
+
+def _vcf_item_generator(
+    manifest: Manifest,
+    tracker: ProgressTracker = None,
+    resumed: dict = None,
+    writer: AnnotatedVCFWriter = None,
+    metrics: RunMetrics = None,
+) -> Generator[tuple, None, None]:
+    """Return a VCFItem for each line in the vcf, recording each file's progress in metrics.
+    Lines annotated before a resumed run (see load_checkpoint) are read but not parsed.
+    With a writer, every line is also handed to it to be written once its items are translated.
+    """
+    tracker = tracker or ProgressTracker()
+    resumed = resumed or {}
+    metrics = metrics if metrics is not None else RunMetrics()
     total_lines = 0
     for work_file in tqdm(
         _work_file_generator(manifest),
@@ -59,58 +185,89 @@ def _vcf_item_generator(manifest: Manifest) -> Generator[tuple, None, None]:
         disable=manifest.disable_progress_bars,
     ):
         line_number = 0
-        if "gz" in str(work_file):
-            f = gzip.open(work_file, "rt")
-        else:
-            f = open(work_file, "r")
-        with f:
-            key = str(work_file)
-            metrics[key][STATUS] = "started"
-            metrics[key][START_TIME] = time.time()
-            metrics[key][SUCCESSES] = 0
-            metrics[key][METAKB_HITS] = 0
-
-            for line in f:
-                if line.startswith("#"):
-                    continue
-
-                line_number += 1
-                total_lines += 1
-
-                for gnomad_id in generate_gnomad_ids(
-                    line, compute_for_ref=manifest.compute_for_ref
-                ):
-                    yield VCFItem(
-                        fmt="gnomad",
-                        var=gnomad_id,
-                        file_name=work_file,
-                        line_number=line_number,
-                    )  # {"fmt": "gnomad", "var": gnomad_id}, work_file, line_number
-
-                if manifest.limit and line_number > manifest.limit:
-                    _logger.info(f"Limit of {manifest.limit} reached, stopping")
-                    break
-
-            _logger.info(f"Setting metrics for {work_file}")
-            metrics[key][STATUS] = "finished"
-            metrics[key][END_TIME] = time.time()
-            metrics[key][LINE_COUNT] = line_number
-            metrics[key][ELAPSED_TIME] = (
-                metrics[key][END_TIME] - metrics[key][START_TIME]
+        key = str(work_file)
+        committed_line, done_lines = 0, set()
+        if key in resumed:
+            file_metrics = metrics.files[key] = FileMetrics.from_dict(
+                resumed[key]["metrics"]
             )
+            committed_line = resumed[key]["committed_line"]
+            done_lines = set(resumed[key]["done_lines"])
+            if (
+                file_metrics.status == "finished"
+                and file_metrics.line_count == committed_line
+            ):
+                _logger.info(f"Skipping {work_file}, finished before resuming")
+                tracker.read(key, committed_line, 0)
+                continue
+            _logger.info(f"Resuming {work_file} after line {committed_line}")
+        else:
+            file_metrics = metrics[key]
+            file_metrics.start(manifest.regions)
+        if writer:
+            output_path = _annotated_vcf_path(work_file, manifest)
+            writer.start(key, _vcf_header(work_file, manifest), output_path)
+            file_metrics.annotated_vcf = str(output_path)
+
+        lines = _vcf_lines(work_file, manifest)
+        if timing.enabled:
+            lines = timing.timed_iter(lines, "read_vcf")
+        for line in lines:
+            line_number += 1
+            total_lines += 1
+
+            gnomad_ids = []
+            if line_number > committed_line and line_number not in done_lines:
+                started = timing.start()
+                gnomad_ids = list(
+                    generate_gnomad_ids(line, compute_for_ref=manifest.compute_for_ref)
+                )
+                timing.stop("generate_gnomad_ids", started)
+            tracker.read(key, line_number, len(gnomad_ids))
+            if writer:
+                writer.read(key, line_number, line, len(gnomad_ids))
+            for gnomad_id in gnomad_ids:
+                yield VCFItem(
+                    fmt="gnomad",
+                    var=gnomad_id,
+                    file_name=work_file,
+                    line_number=line_number,
+                )  # {"fmt": "gnomad", "var": gnomad_id}, work_file, line_number
+
+            if manifest.limit and line_number > manifest.limit:
+                _logger.info(f"Limit of {manifest.limit} reached, stopping")
+                break
+
+        if writer:
+            writer.finish(key)
+        _logger.info(f"Setting metrics for {work_file}")
+        file_metrics.finish(line_number)
 
     _logger.info(
         f"_vcf_generator: Finished processing all files in the manifest {total_lines} lines processed."
     )
 
 
-def _vrs_generator(manifest: Manifest) -> Generator[dict, None, None]:
+def _vrs_generator(
+    manifest: Manifest,
+    tracker: ProgressTracker = None,
+    resumed: dict = None,
+    writer: AnnotatedVCFWriter = None,
+    metrics: RunMetrics = None,
+) -> Generator[dict, None, None]:
     """Return a generator for the VRS ids."""
-    tlr = Translator(normalize=manifest.normalize)
+    tlr = Translator(
+        normalize=manifest.normalize,
+        mode=manifest.translation_mode,
+        batch_size=manifest.batch_size,
+        preserve_order=manifest.preserve_order,
+        deduplicate=manifest.deduplicate,
+        threads_per_process=manifest.threads_per_process,
+    )
     c = 0
     for result in tlr.translate_from(
         generator=tqdm(
-            _vcf_item_generator(manifest),
+            _vcf_item_generator(manifest, tracker, resumed, writer, metrics),
             total=manifest.estimated_vcf_lines,
             disable=manifest.disable_progress_bars,
         ),
@@ -128,84 +285,187 @@ def vrs_ids(allele: VRS.Allele) -> list[str]:
     return [allele.id]  # , allele.location.id, allele.location.sequence_id]
 
 
+def _write_checkpoint(
+    path: pathlib.Path, tracker: ProgressTracker, metrics: RunMetrics
+):
+    """Checkpoint the progress and metrics of every file read so far."""
+    progress = tracker.progress()
+    write_checkpoint(
+        path,
+        progress,
+        {file_name: metrics[file_name].to_dict() for file_name in progress},
+    )
+
+
+def _count_result(
+    metrics: RunMetrics, file_path: str, result: VCFItem, metakb_hit: bool
+):
+    """Add a result to its file's metrics."""
+    if result.error:
+        # counted per exception class
+        metrics[file_path].add_error(result.error)
+    else:
+        metrics[file_path].successes += 1
+        if metakb_hit:
+            # add vrs_id, allele_dict, actual evidence to this object as well (#3)
+            metrics.add_match(file_path, result.result, result.fmt, result.var)
+
+
 def annotate_all(
-    manifest: Manifest, max_errors: int, timestamp_str: str = None
+    manifest: Manifest, max_errors: int, timestamp_str: str = None, resume: bool = False
 ) -> pathlib.Path:
-    """Annotate all the files in the manifest. Return a file with metrics."""
+    """Annotate all the files in the manifest. Return a file with metrics.
+    With resume, continue from the manifest's last checkpoint.
+    """
 
     # set the manifest in a well known place, TODO: is this really necessary
     _logger.info("annotate_all: Starting.")
     vrs_anvil.manifest = manifest
+    timing.enable(manifest.timing)
     metakb_proxy = vrs_anvil.MetaKBProxy(
         metakb_path=pathlib.Path(manifest.metakb_directory),
         cache_path=pathlib.Path(manifest.cache_directory),
     )
     _logger.info("annotate_all: completed metakb init.")
 
-    metrics[TOTAL][START_TIME] = time.time()
+    # pick translation_mode, num_threads and threads_per_process by timing them on the first variants
+    tuning = None
+    if manifest.autotune:
+        items = _vcf_item_generator(manifest)
+        try:
+            calibration = list(itertools.islice(items, manifest.autotune_variants))
+        finally:
+            items.close()
+        if calibration:
+            tuning = autotune(manifest, calibration)
+        else:
+            _logger.warning("annotate_all: no variants to autotune with")
+    # time only the run itself, not the calibration, whose pool workers reported their own timings
+    timing.reset()
+    reset_stats()
+    # the cache counters are per process, report this run's share of them
+    cache_stats_before = cache_stats()
+
+    # progress is checkpointed so a run that dies can be resumed, see annotate --resume
+    _checkpoint_path = checkpoint_path(manifest)
+    resumed = load_checkpoint(_checkpoint_path) if resume else {}
+    writer = None
+    if manifest.annotate_vcfs:
+        writer = AnnotatedVCFWriter(compute_for_ref=manifest.compute_for_ref)
+        if resumed:
+            _logger.warning(
+                "annotate_all: annotated vcfs are written from the start, ignoring the checkpoint"
+            )
+            resumed = {}
+    if resumed:
+        _logger.info(f"annotate_all: resuming from {_checkpoint_path}")
+    if not timestamp_str:
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    state_directory = pathlib.Path(manifest.state_directory)
+
+    # metrics are per run, MetaKB matches can be spilled to disk rather than held until the end
+    matches_sink = None
+    if manifest.spill_matches:
+        matches_sink = ResultsSink(
+            state_directory / f"matches_{timestamp_str}.parquet",
+            batch_size=manifest.results_batch_size,
+            schema=MATCHES_SCHEMA,
+        )
+    metrics = RunMetrics(matches_sink)
+    if tuning:
+        metrics.total[AUTOTUNE] = tuning
+    sink = None
+    if manifest.results_format:
+        results_path = (
+            state_directory / f"results_{timestamp_str}.{manifest.results_format}"
+        )
+        sink = ResultsSink(
+            results_path, manifest.results_format, manifest.results_batch_size
+        )
+        metrics.total[RESULTS] = str(results_path)
+    tracker = ProgressTracker()
+    next_checkpoint = time.monotonic() + manifest.checkpoint_interval
+    reporter = None
+    if manifest.progress_interval:
+        reporter = ProgressReporter(
+            state_directory / f"progress_{timestamp_str}.yaml",
+            manifest.progress_interval,
+        )
+
+    start_time = time.time()
     total_errors = 0
-    for result in _vrs_generator(manifest):
-        assert result is not None, "result is None"
-        assert isinstance(result, VCFItem), "result is not a VCFItem"
-
-        file_path = str(result.file_name)
-
-        if ERROR in result:
-            errors = metrics[file_path][ERROR]
-            if result[ERROR] not in errors:
-                errors[result[ERROR]] = 0
-            errors[result[ERROR]] += 1
-            total_errors += 1
+    # results of lines with items still being annotated, by (file, line_number)
+    line_results: dict[tuple, list] = {}
+    finished = False
+    try:
+        for result in _vrs_generator(manifest, tracker, resumed, writer, metrics):
+            assert result is not None, "result is None"
+            assert isinstance(result, VCFItem), "result is not a VCFItem"
+
+            file_path = str(result.file_name)
+            if writer:
+                writer.done(result)
+
+            metakb_hit = False
+            if result.error:
+                total_errors += 1
+            else:
+                allele_id = result.result
+
+                # check metaKB cache, TODO - it would be nice if we had the metakb.study.id and added that to result_dict
+                started = timing.start()
+                metakb_hit = bool(metakb_proxy.get(allele_id))
+                timing.stop("metakb_get", started)
+                if metakb_hit:
+                    _logger.info(f"VRS id {allele_id} found in metakb. {result}")
+            if sink:
+                sink.write(result, metakb_hit)
+
+            # a line is counted once all of its items are annotated, so checkpointed metrics
+            # never include a partly annotated line that a resumed run annotates again
+            line = (file_path, result.line_number)
+            line_results.setdefault(line, []).append((result, metakb_hit))
+            if tracker.done(file_path, result.line_number):
+                for line_result, line_metakb_hit in line_results.pop(line):
+                    _count_result(metrics, file_path, line_result, line_metakb_hit)
             if total_errors > max_errors:
                 break
-        else:
-            allele_id = result.result
-
-            metrics[file_path][SUCCESSES] += 1
 
-            # check metaKB cache, TODO - it would be nice if we had the metakb.study.id and added that to result_dict
-            if metakb_proxy.get(allele_id):
-                _logger.info(f"VRS id {allele_id} found in metakb. {result}")
-
-                # add vrs_id, allele_dict, actual evidence to this object as well (#3)
-                metrics[file_path][MATCHES][allele_id] = {
-                    "fmt": result.fmt,
-                    "var": result.var,
-                }
-
-                metrics[file_path][METAKB_HITS] += 1
+            if manifest.checkpoint_interval and time.monotonic() >= next_checkpoint:
+                _write_checkpoint(_checkpoint_path, tracker, metrics)
+                next_checkpoint = time.monotonic() + manifest.checkpoint_interval
+            if reporter:
+                reporter.maybe_write(metrics, tracker)
+        else:
+            finished = True
+    finally:
+        if writer:
+            writer.close()
+        if sink:
+            sink.close()
+        if matches_sink:
+            matches_sink.close()
+        if finished:
+            _checkpoint_path.unlink(missing_ok=True)
+        elif manifest.checkpoint_interval:
+            _write_checkpoint(_checkpoint_path, tracker, metrics)
+        if reporter:
+            reporter.write(metrics, tracker, "finished" if finished else "stopped")
 
     _logger.info("annotate_all: Finished processing results.")
 
-    metrics[TOTAL][TIMESTAMP] = timestamp_str
-    metrics[TOTAL][END_TIME] = time.time()
-    metrics[TOTAL][ELAPSED_TIME] = metrics[TOTAL][END_TIME] - metrics[TOTAL][START_TIME]
-    metrics[TOTAL][SUCCESSES] = sum(
-        [metrics[key].get(SUCCESSES, 0) for key in metrics.keys() if key != TOTAL]
-    )
-    metrics[TOTAL]["errors"] = sum(
-        [sum(metrics[key]["errors"].values()) for key in metrics.keys() if key != TOTAL]
+    # hits, misses and evictions per allele translator cache tier
+    metrics.finish(
+        start_time, timestamp_str, diff_cache_stats(cache_stats(), cache_stats_before)
     )
+    if manifest.timing:
+        # cumulative seconds and calls per stage and worker
+        metrics.total[TIMING] = timing.summarize(timing_stats())
 
     _logger.info("annotate_all: Finished calculating metrics.")
 
-    # Append timestamp or suffix to filename
-    if not timestamp_str:
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    metrics_file = (
-        pathlib.Path(manifest.state_directory) / f"metrics_{timestamp_str}.yaml"
-    )
-    with open(metrics_file, "w") as f:
-        # clean up the recursive dict into a plain old dict so that it serialized to yaml neatly
-        for k, v in metrics.items():
-            metrics[k] = dict(v)
-            if k != TOTAL:
-                if "errors" in metrics[k]:
-                    metrics[k]["errors"] = dict(metrics[k]["errors"])
-                if MATCHES in metrics[k]:
-                    metrics[k][MATCHES] = dict(metrics[k][MATCHES])
-
-        yaml.dump(dict(metrics), f)
+    metrics_file = state_directory / f"metrics_{timestamp_str}.yaml"
+    metrics.dump(metrics_file)
 
     _logger.info("annotate_all: Finished writing metrics.")
 
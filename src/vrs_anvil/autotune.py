@@ -0,0 +1,104 @@
+import logging
+import os
+import time
+
+import vrs_anvil
+from vrs_anvil import Manifest
+from vrs_anvil.translator import Translator, VCFItem
+
+_logger = logging.getLogger("vrs_anvil.autotune")
+
+# items translated inline before timing, warms up seqrepo's file handles and caches
+WARMUP_ITEMS = 100
+
+
+def candidates(cpus: int) -> list[tuple[str, int, int]]:
+    """Return the (translation_mode, num_threads, threads_per_process) configurations worth trying on a host with cpus cores."""
+    limit = max(2, cpus * 2)
+    threads = [1] + [2**_ for _ in range(1, 8) if 2**_ <= limit]
+    processes = [2**_ for _ in range(1, 8) if 2**_ <= cpus]
+    return [("thread", _, 1) for _ in threads] + [
+        ("process", _, per_process)
+        for _ in processes
+        for per_process in [1, 2, 4]
+        if _ * per_process <= limit
+    ]
+
+
+def candidate_name(mode: str, num_threads: int, threads_per_process: int) -> str:
+    name = f"{mode}_{num_threads}"
+    return name if threads_per_process == 1 else f"{name}x{threads_per_process}"
+
+
+def measure(
+    items: list[VCFItem],
+    mode: str,
+    num_threads: int,
+    manifest: Manifest,
+    threads_per_process: int = 1,
+) -> float:
+    """Return the items per second translated by a configuration.
+    The clock starts when the first item is read, after the translator has started its worker threads or processes,
+    so a short calibration is not dominated by startup a long run only pays once.
+    """
+    # small enough that every worker gets several batches
+    workers = num_threads * threads_per_process
+    batch_size = max(1, min(manifest.batch_size, len(items) // (workers * 4)))
+    tlr = Translator(
+        normalize=manifest.normalize,
+        mode=mode,
+        batch_size=batch_size,
+        preserve_order=manifest.preserve_order,
+        threads_per_process=threads_per_process,
+    )
+    start = None
+
+    def timed_items():
+        nonlocal start
+        start = time.perf_counter()
+        yield from items
+
+    for _ in tlr.translate_from(timed_items(), num_threads=num_threads):
+        pass
+    return len(items) / (time.perf_counter() - start)
+
+
+def autotune(manifest: Manifest, items: list[VCFItem], cpus: int = None) -> dict:
+    """Time each candidate configuration on items and set the fastest as the manifest's translation_mode, num_threads and threads_per_process.
+    The cache and lookup table are disabled while calibrating, otherwise every run after the first would only measure cache hits.
+    Return the chosen configuration and the rate of each candidate.
+    """
+    cpus = cpus or os.cpu_count()
+    manifest_ = vrs_anvil.manifest
+    vrs_anvil.manifest = manifest.model_copy(
+        update={"cache_enabled": False, "vrs_lookup_table": None}
+    )
+    try:
+        measure(items[:WARMUP_ITEMS], "thread", 1, manifest)
+        configurations, rates = {}, {}
+        for configuration in candidates(cpus):
+            name = candidate_name(*configuration)
+            mode, num_threads, threads_per_process = configuration
+            configurations[name] = configuration
+            rates[name] = rate = measure(
+                items, mode, num_threads, manifest, threads_per_process
+            )
+            _logger.info(f"autotune: {name}: {rate:.1f} items/s")
+    finally:
+        vrs_anvil.manifest = manifest_
+
+    best = max(rates, key=rates.get)
+    mode, num_threads, threads_per_process = configurations[best]
+    manifest.translation_mode = mode
+    manifest.num_threads = num_threads
+    manifest.threads_per_process = threads_per_process
+    _logger.info(
+        f"autotune: using {best} from {len(items)} items, {rates[best]:.1f} items/s"
+    )
+    return {
+        "translation_mode": mode,
+        "num_threads": num_threads,
+        "threads_per_process": threads_per_process,
+        "items": len(items),
+        "rates": {k: round(v, 1) for k, v in rates.items()},
+    }
@@ -0,0 +1,107 @@
+import collections
+import io
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Generator
+
+# gzip magic, deflate, FEXTRA flag, see https://samtools.github.io/hts-specs/SAMv1.pdf section 4.1
+BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+BGZF_HEADER = struct.Struct("<4sIBBH")  # magic, mtime, xfl, os, xlen
+BGZF_TRAILER = struct.Struct("<II")  # crc32, isize
+
+
+def is_bgzf(path) -> bool:
+    """Is the file BGZF compressed, i.e. a gzip file whose first member carries the BC block size subfield."""
+    with open(path, "rb") as f:
+        header = f.read(BGZF_HEADER.size)
+        if len(header) < BGZF_HEADER.size or not header.startswith(BGZF_MAGIC):
+            return False
+        *_, xlen = BGZF_HEADER.unpack(header)
+        return _block_size(f.read(xlen)) is not None
+
+
+def _block_size(extra: bytes) -> int:
+    """Return the total block size from the BC subfield of a BGZF header's extra field, or None."""
+    i = 0
+    while i + 4 <= len(extra):
+        si1, si2, slen = struct.unpack_from("<BBH", extra, i)
+        if si1 == 66 and si2 == 67 and slen == 2:
+            return struct.unpack_from("<H", extra, i + 4)[0] + 1
+        i += 4 + slen
+    return None
+
+
+def _bgzf_blocks(f: BinaryIO) -> Generator[tuple[bytes, int, int], None, None]:
+    """Read the compressed blocks of a BGZF file, yield (deflate data, crc32, uncompressed size)."""
+    while header := f.read(BGZF_HEADER.size):
+        magic, _, _, _, xlen = BGZF_HEADER.unpack(header)
+        if magic != BGZF_MAGIC:
+            raise IOError(f"Not a BGZF block at offset {f.tell() - len(header)}")
+        extra = f.read(xlen)
+        block_size = _block_size(extra)
+        if block_size is None:
+            raise IOError(f"BGZF block without a block size at offset {f.tell()}")
+        data = f.read(block_size - BGZF_HEADER.size - xlen - BGZF_TRAILER.size)
+        crc, isize = BGZF_TRAILER.unpack(f.read(BGZF_TRAILER.size))
+        yield data, crc, isize
+
+
+def _inflate(data: bytes, crc: int, isize: int) -> bytes:
+    """Decompress a single block, zlib releases the GIL so blocks inflate in parallel."""
+    block = zlib.decompress(data, wbits=-15)
+    if len(block) != isize or zlib.crc32(block) != crc:
+        raise IOError("BGZF block failed its size or crc32 check")
+    return block
+
+
+class ParallelBGZFReader(io.RawIOBase):
+    """A read-only binary stream over a BGZF file, blocks are inflated by a pool of threads and reassembled in order."""
+
+    def __init__(self, path, threads: int):
+        super().__init__()
+        self._file = open(path, "rb")
+        self._blocks = _bgzf_blocks(self._file)
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="bgzf"
+        )
+        # blocks submitted ahead of the reader, each is at most 64KB uncompressed
+        self._max_pending = threads * 4
+        self._pending = collections.deque()
+        self._buffer = memoryview(b"")
+        self._submit()
+
+    def _submit(self):
+        """Keep the pool busy with the next blocks of the file."""
+        while len(self._pending) < self._max_pending:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            self._pending.append(self._executor.submit(_inflate, *block))
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            if not self._pending:
+                return 0  # end of file
+            self._buffer = memoryview(self._pending.popleft().result())
+            self._submit()
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._file.close()
+        super().close()
+
+
+def open_bgzf(path, threads: int) -> io.TextIOWrapper:
+    """Open a BGZF file for reading text, a drop in replacement for gzip.open(path, "rt")."""
+    return io.TextIOWrapper(
+        io.BufferedReader(ParallelBGZFReader(path, threads), buffer_size=1024 * 1024)
+    )
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+import yaml
+
+from vrs_anvil import Manifest
+from vrs_anvil.metrics import SafeDumper, SafeLoader
+
+_logger = logging.getLogger("vrs_anvil.checkpoint")
+
+
+def checkpoint_path(manifest: Manifest) -> pathlib.Path:
+    """Return the checkpoint file of a manifest, keyed by the settings that decide which line yields which items."""
+    key = json.dumps(
+        [
+            manifest.vcf_files,
+            manifest.regions,
+            manifest.limit,
+            manifest.compute_for_ref,
+        ]
+    )
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return pathlib.Path(manifest.state_directory) / f"checkpoint_{digest}.yaml"
+
+
+class ProgressTracker:
+    """Track which lines of each file have had all of their items annotated.
+    Results may arrive out of order, so progress is the line before the first line with pending items.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # items still to be annotated per line, in the order lines were read
+        self._pending: dict[str, dict[int, int]] = {}
+        self._last_read: dict[str, int] = {}
+
+    def read(self, file_name: str, line_number: int, items: int):
+        """Record that a line was read and how many items it yielded."""
+        with self._lock:
+            self._last_read[file_name] = line_number
+            if items:
+                self._pending.setdefault(file_name, {})[line_number] = items
+
+    def done(self, file_name: str, line_number: int) -> bool:
+        """Record that one of a line's items was annotated, return True if it was the line's last."""
+        with self._lock:
+            pending = self._pending[file_name]
+            pending[line_number] -= 1
+            if not pending[line_number]:
+                del pending[line_number]
+                return True
+            return False
+
+    def lines_read(self) -> int:
+        """Return the number of lines read across all files."""
+        with self._lock:
+            return sum(self._last_read.values())
+
+    def _committed_line(self, file_name: str) -> int:
+        pending = self._pending.get(file_name)
+        if pending:
+            return next(iter(pending)) - 1
+        return self._last_read.get(file_name, 0)
+
+    def committed_line(self, file_name: str) -> int:
+        """Return the last line such that it and every line before it have been annotated."""
+        with self._lock:
+            return self._committed_line(file_name)
+
+    def progress(self) -> dict:
+        """Return {file: {committed_line, done_lines}}, done_lines are the annotated lines after committed_line."""
+        with self._lock:
+            progress = {}
+            for file_name, last_read in self._last_read.items():
+                committed_line = self._committed_line(file_name)
+                pending = self._pending.get(file_name, {})
+                progress[file_name] = {
+                    "committed_line": committed_line,
+                    "done_lines": [
+                        _
+                        for _ in range(committed_line + 1, last_read + 1)
+                        if _ not in pending
+                    ],
+                }
+            return progress
+
+
+def write_checkpoint(path: pathlib.Path, progress: dict, metrics: dict):
+    """Atomically write the progress and metrics of each file."""
+    checkpoint = {
+        "time": time.time(),
+        "files": {
+            file_name: {**file_progress, "metrics": metrics.get(file_name, {})}
+            for file_name, file_progress in progress.items()
+        },
+    }
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as stream:
+        yaml.dump(checkpoint, stream, Dumper=SafeDumper)
+    os.replace(tmp_path, path)
+    _logger.debug(f"Checkpoint written to {path}")
+
+
+def load_checkpoint(path: pathlib.Path) -> dict:
+    """Return {file: {committed_line, done_lines, metrics}} from a checkpoint, empty if there is none."""
+    if not path.exists():
+        return {}
+    with open(path, "r") as stream:
+        checkpoint = yaml.load(stream, Loader=SafeLoader)
+    return checkpoint["files"]
@@ -1,3 +1,4 @@
+import collections
 import os
 from datetime import datetime
 
@@ -10,8 +11,16 @@ from vrs_anvil import (
     run_command_in_background,
     get_process_info,
     save_manifest,
+    export_allele_translator_cache,
+    import_allele_translator_cache,
 )
 from vrs_anvil.annotator import annotate_all
+from vrs_anvil.gather import gather_metrics
+from vrs_anvil.lookup import build_lookup_table
+from vrs_anvil.profiler import SamplingProfiler
+from vrs_anvil.progress import format_progress, load_progress
+from vrs_anvil.regions import index_path, split_regions
+from vrs_anvil.scatter import ScatterJob, job_size, run_scattered
 from logging.handlers import RotatingFileHandler
 import pathlib
 
@@ -34,8 +43,25 @@ _logger = logging.getLogger("vrs_anvil.cli")
 @click.option(
     "--suffix", default=None, help="Substitute timestamp with alternate file suffix"
 )
+@click.option(
+    "--profile",
+    default=False,
+    is_flag=True,
+    help="Sample the stacks of all threads, translation worker processes included, writing profile_<suffix>.txt and .folded to the state directory.",
+)
+@click.option(
+    "--profile_top", default=25, help="Number of functions in the profile summary."
+)
 @click.pass_context
-def cli(ctx, verbose: bool, manifest: str, max_errors: int, suffix: str):
+def cli(
+    ctx,
+    verbose: bool,
+    manifest: str,
+    max_errors: int,
+    suffix: str,
+    profile: bool,
+    profile_top: int,
+):
     """GA4GH GKS utility for AnVIL."""
 
     _log_level = logging.INFO
@@ -85,14 +111,33 @@ def cli(ctx, verbose: bool, manifest: str, max_errors: int, suffix: str):
             ctx.obj["verbose"] = verbose
             ctx.obj["max_errors"] = max_errors
             ctx.obj["timestamp_str"] = timestamp_str
+            ctx.obj["profile"] = profile
 
             if verbose:
                 click.secho(f"📢  {manifest}", fg="green")
+
+            if profile:
+                profiler = SamplingProfiler().start()
+                ctx.call_on_close(
+                    lambda: _write_profile(
+                        profiler, manifest.state_directory, timestamp_str, profile_top
+                    )
+                )
     except Exception as exc:
         click.secho(f"{exc}", fg="yellow")
         ctx.ensure_object(dict)
 
 
+def _write_profile(
+    profiler: SamplingProfiler, state_directory: str, timestamp_str: str, top: int
+):
+    """Stop the profiler and report where its output went."""
+    profiler.stop()
+    summary_path = profiler.write(state_directory, timestamp_str, top)
+    click.echo(summary_path.read_text())
+    click.secho(f"🔬 Profile written to {summary_path}", fg="yellow")
+
+
 @cli.command("annotate")
 @click.option(
     "--scatter",
@@ -102,17 +147,55 @@ def cli(ctx, verbose: bool, manifest: str, max_errors: int, suffix: str):
     is_flag=True,
     show_default=True,
 )
+@click.option(
+    "--regions",
+    help="With --scatter, split each indexed VCF into this many regions balanced by size, one background process per region.",
+    required=False,
+    default=None,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--resume",
+    help="Continue from the last checkpoint of this manifest's files instead of starting over.",
+    required=False,
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--autotune",
+    help="Time several thread and process counts on the first variants and annotate with the fastest. Ignored with --scatter, children use one thread.",
+    required=False,
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--timing",
+    help="Record the time spent in each stage of the pipeline per worker in the metrics file.",
+    required=False,
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
 @click.pass_context
-def annotate_cli(ctx, scatter: bool):
+def annotate_cli(
+    ctx, scatter: bool, regions: int, resume: bool, autotune: bool, timing: bool
+):
     """Read manifest file, annotate variants, all parameters controlled by manifest.yaml."""
 
     assert "manifest" in ctx.obj, "Manifest not found."
     timestamp_str = ctx.obj["timestamp_str"]
+    if timing:
+        # saved in the scattered children's manifests too
+        ctx.obj["manifest"].timing = True
 
     # normal run with single process
     if not scatter:
         try:
             manifest = ctx.obj["manifest"]
+            if autotune:
+                manifest.autotune = True
             manifest_path = f"{manifest.work_directory}/manifest_{timestamp_str}.yaml"
             save_manifest(manifest, manifest_path)
             click.secho(f"🔑 Manifest saved at {manifest_path}", fg="yellow")
@@ -120,7 +203,10 @@ def annotate_cli(ctx, scatter: bool):
 
             click.secho("🚧  annotating variants", fg="yellow")
             metrics_file = annotate_all(
-                manifest, max_errors=ctx.obj["max_errors"], timestamp_str=timestamp_str
+                manifest,
+                max_errors=ctx.obj["max_errors"],
+                timestamp_str=timestamp_str,
+                resume=resume,
             )
             click.secho(f"📊  metrics available in {metrics_file}", fg="green")
         except Exception as exc:
@@ -129,17 +215,39 @@ def annotate_cli(ctx, scatter: bool):
     else:  # scattered processes / multiprocessing
         try:
             parent_manifest = ctx.obj["manifest"]
-            scattered_processes = []
-            child_processes = []
 
-            for i, vcf_file in enumerate(parent_manifest.vcf_files):
+            # one child per VCF file, or per region shard of each indexed VCF file
+            jobs = []
+            for vcf_file in parent_manifest.vcf_files:
+                if regions and index_path(vcf_file):
+                    jobs.extend(
+                        (vcf_file, shard) for shard in split_regions(vcf_file, regions)
+                    )
+                else:
+                    if regions:
+                        click.secho(
+                            f"⚠️  {vcf_file} is not indexed, annotating it in one process",
+                            fg="yellow",
+                        )
+                    jobs.append((vcf_file, None))
+
+            # regions of a file are balanced by compressed size, so share its size evenly
+            shards_per_file = collections.Counter(vcf_file for vcf_file, _ in jobs)
+
+            child_suffixes = []
+            scatter_jobs = []
+            for i, (vcf_file, shard) in enumerate(jobs):
                 # create a new manifest for each VCF file based on the parent manifest
                 child_manifest = parent_manifest.copy(deep=True)
                 child_manifest.vcf_files = [vcf_file]
+                if shard:
+                    child_manifest.regions = shard
                 child_manifest.num_threads = 1
+                child_manifest.autotune = False
                 child_manifest.disable_progress_bars = True
 
                 suffix_str = f"scattered_{timestamp_str}_{i}"
+                child_suffixes.append(suffix_str)
                 child_manifest_path = (
                     pathlib.Path(child_manifest.work_directory)
                     / f"manifest_{suffix_str}.yaml"
@@ -148,59 +256,189 @@ def annotate_cli(ctx, scatter: bool):
                 click.secho(f"🔑 Manifest saved at {child_manifest_path}", fg="yellow")
                 _logger.debug(f"Manifest: {ctx.obj['manifest']}")
 
-                # run process to annotate each manifest
-                process = run_command_in_background(
-                    f"vrs_bulk --manifest {child_manifest_path} --suffix {suffix_str} annotate"
-                )
-                click.secho(
-                    f"🚧  annotating {vcf_file} on pid {process.pid}", fg="yellow"
+                scattered_process = {
+                    "manifest": str(child_manifest_path),
+                    "vcf": vcf_file,
+                }
+                if shard:
+                    scattered_process["regions"] = shard
+                scatter_jobs.append(
+                    ScatterJob(
+                        command=f"vrs_bulk --manifest {child_manifest_path} --suffix {suffix_str}{' --profile' if ctx.obj['profile'] else ''} annotate{' --resume' if resume else ''}",
+                        size=job_size(vcf_file, shards_per_file[vcf_file]),
+                        record=scattered_process,
+                    )
                 )
-                scattered_processes.append(
-                    {
-                        "pid": process.pid,
-                        "manifest": str(child_manifest_path),
-                        "vcf": vcf_file,
-                    }
-                )
-                child_processes.append(process)
 
-            # associate scattered processes to process id in yaml
+            # associate scattered processes to process id in yaml, rewritten as children start and exit
             scattered_processes_path = (
                 pathlib.Path(parent_manifest.work_directory)
                 / f"scattered_processes_{timestamp_str}.yaml"
             )
-            scattered_processes = {
-                "parent_pid": os.getpid(),
-                "processes": scattered_processes,
-            }
-            with open(scattered_processes_path, "w") as stream:
-                yaml.dump(scattered_processes, stream)
+
+            def write_scattered_processes():
+                with open(scattered_processes_path, "w") as stream:
+                    yaml.dump(
+                        {
+                            "parent_pid": os.getpid(),
+                            "processes": [_.record for _ in scatter_jobs],
+                        },
+                        stream,
+                    )
+
+            max_processes = parent_manifest.max_scattered_processes or os.cpu_count()
             click.secho(
                 f"📊 scattered processes available in {scattered_processes_path}",
                 fg="green",
             )
 
-            # ensure all processes completed
-            click.secho("🕒 waiting for processes to complete", fg="yellow")
+            # run the children, largest first, at most max_processes at a time
+            click.secho(
+                f"🕒 running {len(scatter_jobs)} processes, {max_processes} at a time",
+                fg="yellow",
+            )
             try:
-                for process in child_processes:
-                    process.wait()
+                run_scattered(
+                    scatter_jobs,
+                    max_processes,
+                    start=run_command_in_background,
+                    on_change=write_scattered_processes,
+                )
             except KeyboardInterrupt:
+                # the children's metrics are partial, leave gathering them to the user
+                click.secho(
+                    "🚨 caught KeyboardInterrupt, terminated child processes",
+                    fg="red",
+                )
                 click.secho(
-                    "🚨 caught KeyboardInterrupt, terminating child processes",
+                    f"🛑  scatter run {timestamp_str} interrupted, metrics not gathered, see `vrs_bulk gather --timestamp {timestamp_str}`",
                     fg="red",
                 )
-                for process in child_processes:
-                    process.terminate()
-                for process in child_processes:
-                    process.wait()
+                return
 
             click.secho("✅  all processes completed", fg="green")
+
+            # merge the per file / per region metrics of the children
+            state_directory = pathlib.Path(parent_manifest.state_directory)
+            metrics_paths = [
+                state_directory / f"metrics_{suffix_str}.yaml"
+                for suffix_str in child_suffixes
+            ]
+            missing = [str(_) for _ in metrics_paths if not _.exists()]
+            if missing:
+                click.secho(f"🚨 no metrics written by {missing}", fg="red")
+            _gather(
+                [_ for _ in metrics_paths if _.exists()], state_directory, timestamp_str
+            )
         except Exception as exc:
             click.secho(f"{exc}", fg="red")
             _logger.exception(exc)
 
 
+def _gather(
+    metrics_paths: list[pathlib.Path], state_directory: pathlib.Path, timestamp_str: str
+):
+    """Merge scattered metrics into metrics_<timestamp>.yaml and matches_<timestamp>.parquet."""
+    matches_path = state_directory / f"matches_{timestamp_str}.parquet"
+    metrics_file = gather_metrics(
+        metrics_paths,
+        state_directory / f"metrics_{timestamp_str}.yaml",
+        timestamp_str,
+        matches_path=matches_path,
+    )
+    click.secho(f"📊  merged metrics available in {metrics_file}", fg="green")
+    click.secho(f"📊  matches table available in {matches_path}", fg="green")
+
+
+@cli.command("gather")
+@click.option(
+    "--timestamp",
+    default=None,
+    help="Timestamp of the scatter run to gather, defaults to the most recent one.",
+)
+@click.argument("metrics_paths", nargs=-1, type=click.Path(exists=True))
+@click.pass_context
+def gather_cli(ctx, timestamp: str, metrics_paths: tuple[str]):
+    """Merge the metrics files of a scatter run (or METRICS_PATHS) into one summary and a matches table."""
+
+    try:
+        assert "manifest" in ctx.obj, "Manifest not found."
+        manifest = ctx.obj["manifest"]
+        state_directory = pathlib.Path(manifest.state_directory)
+
+        if metrics_paths:
+            timestamp = timestamp or ctx.obj["timestamp_str"]
+            metrics_paths = [pathlib.Path(_) for _ in metrics_paths]
+        else:
+            if not timestamp:
+                scattered_processes_paths = sorted(
+                    pathlib.Path(manifest.work_directory).glob(
+                        "scattered_processes_*.yaml"
+                    )
+                )
+                assert (
+                    scattered_processes_paths
+                ), f"no scattered processes found in {manifest.work_directory}"
+                timestamp = scattered_processes_paths[-1].stem.removeprefix(
+                    "scattered_processes_"
+                )
+            metrics_paths = sorted(
+                state_directory.glob(f"metrics_scattered_{timestamp}_*.yaml")
+            )
+            assert metrics_paths, f"no metrics found for scatter run {timestamp}"
+
+        click.secho(f"🚧  gathering {len(metrics_paths)} metrics files", fg="yellow")
+        _gather(metrics_paths, state_directory, timestamp)
+    except Exception as exc:
+        click.secho(f"{exc}", fg="red")
+        _logger.exception(exc)
+
+
+@cli.command("export-cache")
+@click.argument("path", type=click.Path(dir_okay=False))
+@click.pass_context
+def export_cache_cli(ctx, path: str):
+    """Export the allele translator cache to a sorted, gzipped gnomAD expression -> VRS id file."""
+
+    try:
+        assert "manifest" in ctx.obj, "Manifest not found."
+        count = export_allele_translator_cache(ctx.obj["manifest"], path)
+        click.secho(f"📦  exported {count} VRS ids to {path}", fg="green")
+    except Exception as exc:
+        click.secho(f"{exc}", fg="red")
+        _logger.exception(exc)
+
+
+@cli.command("import-cache")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.pass_context
+def import_cache_cli(ctx, path: str):
+    """Pre-warm the allele translator cache from a file written by export-cache."""
+
+    try:
+        assert "manifest" in ctx.obj, "Manifest not found."
+        count = import_allele_translator_cache(ctx.obj["manifest"], path)
+        click.secho(f"📦  imported {count} VRS ids from {path}", fg="green")
+    except Exception as exc:
+        click.secho(f"{exc}", fg="red")
+        _logger.exception(exc)
+
+
+@cli.command("build-lookup")
+@click.argument("table_path", type=click.Path(dir_okay=False))
+@click.argument("vcf_paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.pass_context
+def build_lookup_cli(ctx, table_path: str, vcf_paths: tuple[str]):
+    """Build a VRS id lookup table (see manifest vrs_lookup_table) from VRS annotated VCFs."""
+
+    try:
+        count = build_lookup_table(list(vcf_paths), table_path)
+        click.secho(f"📦  wrote {count} VRS ids to {table_path}", fg="green")
+    except Exception as exc:
+        click.secho(f"{exc}", fg="red")
+        _logger.exception(exc)
+
+
 # TODO: allow user to pass in a particular timestamp?
 @cli.command("ps")
 @click.pass_context
@@ -254,6 +492,18 @@ def ps_cli(ctx):
                     f"🚧  pid: {str(process['pid'])}, manifest: {str(process['manifest'])}, vcf: {str(process['vcf'])}, metrics_file: {metrics_file}, log_file: {log_file}",
                     fg="yellow",
                 )
+                # throughput snapshots written by annotate, see Manifest.progress_interval
+                progress_files = sorted(
+                    state_dir.glob(f"progress_*{timestamp_str}.yaml")
+                )
+                if progress_files:
+                    click.secho(
+                        f"  📈 {format_progress(load_progress(progress_files[-1]))}",
+                        fg="yellow",
+                    )
+                if process.get("pid") is None:
+                    click.secho("  ⏳  queued", fg="yellow")
+                    continue
                 process_info = get_process_info(process["pid"])
                 if not process_info or metrics_file != "NA":
                     click.secho("  ✅  completed", fg="green")
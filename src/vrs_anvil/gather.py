@@ -0,0 +1,129 @@
+import logging
+import pathlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+from vrs_anvil import sum_cache_stats
+from vrs_anvil.timing import merge_summaries
+from vrs_anvil.metrics import (
+    CACHE,
+    ELAPSED_TIME,
+    END_TIME,
+    ERRORS,
+    LINE_COUNT,
+    MATCHES,
+    MATCHES_FILE,
+    MATCHES_SCHEMA,
+    METAKB_HITS,
+    PARAMETERS,
+    REGIONS,
+    START_TIME,
+    STATUS,
+    SUCCESSES,
+    TIMESTAMP,
+    TIMING,
+    TOTAL,
+    SafeDumper,
+    SafeLoader,
+)
+
+_logger = logging.getLogger("vrs_anvil.gather")
+
+# per file counters that add up across scattered runs
+COUNTERS = [SUCCESSES, METAKB_HITS, LINE_COUNT]
+
+
+def _merge_file_metrics(merged: dict, metrics: dict):
+    """Merge the metrics of one vcf file (or region of it) into merged."""
+    for key, value in metrics.items():
+        if key in COUNTERS:
+            merged[key] = merged.get(key, 0) + value
+        elif key == START_TIME:
+            merged[key] = min(merged.get(key, value), value)
+        elif key == END_TIME:
+            merged[key] = max(merged.get(key, value), value)
+        elif key == ERRORS:
+            errors = merged.setdefault(key, {})
+            for error, count in value.items():
+                errors[error] = errors.get(error, 0) + count
+        elif key == MATCHES:
+            merged.setdefault(key, {}).update(value)
+        elif key == REGIONS:
+            merged.setdefault(key, []).extend(value)
+        elif key == STATUS:
+            # finished only once every region has finished
+            if merged.get(key, "finished") == "finished":
+                merged[key] = value
+        elif key != ELAPSED_TIME:
+            merged.setdefault(key, value)
+    if START_TIME in merged and END_TIME in merged:
+        merged[ELAPSED_TIME] = merged[END_TIME] - merged[START_TIME]
+
+
+def merge_metrics(metrics_list: list[dict], timestamp_str: str = None) -> dict:
+    """Merge the metrics of scattered annotate runs into the layout annotate_all writes."""
+    merged = {TOTAL: {}}
+    for metrics in metrics_list:
+        for key, value in metrics.items():
+            if key != TOTAL:
+                _merge_file_metrics(merged.setdefault(key, {}), value)
+
+    totals = [metrics.get(TOTAL, {}) for metrics in metrics_list]
+    total = merged[TOTAL]
+    total[TIMESTAMP] = timestamp_str
+    if totals:
+        # wall time of the scatter, from the first child's start to the last child's end
+        total[START_TIME] = min(_.get(START_TIME, float("inf")) for _ in totals)
+        total[END_TIME] = max(_.get(END_TIME, float("-inf")) for _ in totals)
+        total[ELAPSED_TIME] = total[END_TIME] - total[START_TIME]
+    total[SUCCESSES] = sum(_.get(SUCCESSES, 0) for _ in totals)
+    total[ERRORS] = sum(_.get(ERRORS, 0) for _ in totals)
+    total[CACHE] = sum_cache_stats([_.get(CACHE, {}) for _ in totals])
+    timings = [_[TIMING] for _ in totals if TIMING in _]
+    if timings:
+        total[TIMING] = merge_summaries(timings)
+    return merged
+
+
+def matches_table(metrics: dict) -> pa.Table:
+    """Return the MetaKB matches of every vcf file in the metrics as a table, one row per VRS id."""
+    columns = {name: [] for name in MATCHES_SCHEMA.names}
+    for file_name, file_metrics in metrics.items():
+        if file_name == TOTAL:
+            continue
+        for vrs_id, match in file_metrics.get(MATCHES, {}).items():
+            # older metrics nest the translator parameters
+            match = match.get(PARAMETERS, match)
+            columns["file"].append(file_name)
+            columns["vrs_id"].append(vrs_id)
+            columns["fmt"].append(match.get("fmt"))
+            columns["var"].append(match.get("var"))
+    return pa.table(columns, schema=MATCHES_SCHEMA)
+
+
+def gather_metrics(
+    metrics_paths: list[pathlib.Path],
+    merged_path: pathlib.Path,
+    timestamp_str: str = None,
+    matches_path: pathlib.Path = None,
+) -> pathlib.Path:
+    """Merge scattered metrics files into merged_path and optionally their matches into a parquet file, return merged_path."""
+    metrics_list = []
+    for metrics_path in metrics_paths:
+        with open(metrics_path, "r") as stream:
+            metrics_list.append(yaml.load(stream, Loader=SafeLoader))
+    _logger.info(f"Merging {len(metrics_list)} metrics files into {merged_path}")
+    merged = merge_metrics(metrics_list, timestamp_str)
+    with open(merged_path, "w") as stream:
+        yaml.dump(merged, stream, Dumper=SafeDumper)
+    if matches_path:
+        # plus the matches annotate spilled to disk, see Manifest.spill_matches
+        tables = [matches_table(merged)] + [
+            pq.read_table(_[TOTAL][MATCHES_FILE])
+            for _ in metrics_list
+            if _.get(TOTAL, {}).get(MATCHES_FILE)
+        ]
+        pq.write_table(pa.concat_tables(tables), matches_path)
+    return merged_path
@@ -0,0 +1,88 @@
+import hashlib
+import logging
+from typing import Generator, Optional
+
+import numpy as np
+from pysam import VariantFile
+
+_logger = logging.getLogger("vrs_anvil.lookup")
+
+VRS_ID_PREFIX = "ga4gh:VA."
+
+# one row per allele, sorted by (hi, lo): the 128 bit blake2b hash of the gnomAD expression
+# and the 32 character digest of its VRS id
+LOOKUP_TABLE_DTYPE = np.dtype([("hi", "<u8"), ("lo", "<u8"), ("digest", "S32")])
+
+
+def _hash(gnomad_expression: str) -> tuple[int, int]:
+    """Return the 128 bit hash of a gnomAD expression as two 64 bit integers."""
+    digest = hashlib.blake2b(gnomad_expression.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+def annotated_vcf_alleles(vcf_path: str) -> Generator[tuple[str, str], None, None]:
+    """Yield (gnomAD expression, VRS id) pairs from the VRS_Allele_IDs INFO field of a VRS annotated VCF."""
+    with VariantFile(vcf_path, drop_samples=True) as vcf:
+        # VRS_Allele_IDs holds the REF allele's id first if it was computed, see evidence.py
+        includes_ref = "REF" in vcf.header.info["VRS_Allele_IDs"].description
+        for record in vcf:
+            vrs_ids = record.info.get("VRS_Allele_IDs")
+            if not vrs_ids:
+                continue
+            alleles = record.alleles if includes_ref else record.alts
+            for allele, vrs_id in zip(alleles, vrs_ids):
+                if vrs_id:
+                    yield f"{record.chrom}-{record.pos}-{record.ref}-{allele}", vrs_id
+
+
+def build_lookup_table(vcf_paths: list[str], table_path: str) -> int:
+    """Build a lookup table from VRS annotated VCFs, return the number of alleles in it."""
+    rows = {}
+    for vcf_path in vcf_paths:
+        for gnomad_expression, vrs_id in annotated_vcf_alleles(vcf_path):
+            if not vrs_id.startswith(VRS_ID_PREFIX):
+                _logger.warning(f"Skipping {gnomad_expression}, unexpected id {vrs_id}")
+                continue
+            rows[_hash(gnomad_expression)] = vrs_id.removeprefix(VRS_ID_PREFIX)
+
+    table = np.empty(len(rows), dtype=LOOKUP_TABLE_DTYPE)
+    for i, ((hi, lo), digest) in enumerate(rows.items()):
+        table[i] = (hi, lo, digest)
+    table = table[np.lexsort((table["lo"], table["hi"]))]
+
+    with open(table_path, "wb") as f:
+        np.save(f, table)
+    return len(table)
+
+
+class VRSLookupTable:
+    """A memory-mapped gnomAD expression -> VRS id table written by build_lookup_table."""
+
+    def __init__(self, table_path: str):
+        self.table_path = table_path
+        self._table = np.load(table_path, mmap_mode="r")
+        assert (
+            self._table.dtype == LOOKUP_TABLE_DTYPE
+        ), f"{table_path} is not a VRS lookup table"
+        self._hi = self._table["hi"]
+        self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def get(self, gnomad_expression: str) -> Optional[str]:
+        """Return the VRS id of a gnomAD expression, or None if it is not in the table."""
+        hi, lo = _hash(gnomad_expression)
+        i = int(np.searchsorted(self._hi, hi))
+        while i < len(self._table) and self._hi[i] == hi:
+            row = self._table[i]
+            if row["lo"] == lo:
+                self.hits += 1
+                return VRS_ID_PREFIX + row["digest"].decode()
+            i += 1
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        """Return the table's counters."""
+        return {"hits": self.hits, "misses": self.misses}
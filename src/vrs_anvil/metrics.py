@@ -0,0 +1,146 @@
+import logging
+import pathlib
+import time
+from dataclasses import dataclass, field, fields
+
+import pyarrow as pa
+import yaml
+
+_logger = logging.getLogger("vrs_anvil.metrics")
+
+# enums for metrics
+# TODO: do this for keys across files like "parameters" but also "fmt" and "line"
+PARAMETERS = "parameters"
+TOTAL = "total"
+STATUS = "status"
+SUCCESSES = "successes"
+ERROR = "error"
+ERRORS = "errors"
+METAKB_HITS = "metakb_hits"
+MATCHES = "matches"
+START_TIME = "start_time"
+END_TIME = "end_time"
+ELAPSED_TIME = "elapsed_time"
+LINE_COUNT = "line_count"
+VRS_OBJECT = "vrs_object"
+TIMESTAMP = "timestamp_str"
+CACHE = "cache"
+REGIONS = "regions"
+ANNOTATED_VCF = "annotated_vcf"
+RESULTS = "results"
+MATCHES_FILE = "matches_file"
+AUTOTUNE = "autotune"
+TIMING = "timing"
+
+MATCHES_SCHEMA = pa.schema(
+    [
+        ("file", pa.string()),
+        ("vrs_id", pa.string()),
+        ("fmt", pa.string()),
+        ("var", pa.string()),
+    ]
+)
+
+# libyaml is much faster on large metrics files
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+@dataclass(slots=True)
+class FileMetrics:
+    """The metrics of one vcf file (or region of it), fields are named after the keys of the metrics yaml."""
+
+    status: str = None
+    start_time: float = None
+    end_time: float = None
+    elapsed_time: float = None
+    line_count: int = None
+    successes: int = 0
+    metakb_hits: int = 0
+    errors: dict[str, int] = field(default_factory=dict)
+    """count per exception class"""
+    matches: dict[str, dict] = field(default_factory=dict)
+    """{vrs_id: {fmt, var}} of MetaKB hits, empty if they are spilled to disk"""
+    regions: list[str] = None
+    annotated_vcf: str = None
+
+    def start(self, regions: list[str] = None):
+        self.status = "started"
+        self.start_time = time.time()
+        self.successes = 0
+        self.metakb_hits = 0
+        self.regions = regions
+
+    def finish(self, line_count: int):
+        self.status = "finished"
+        self.end_time = time.time()
+        self.line_count = line_count
+        self.elapsed_time = self.end_time - self.start_time
+
+    def add_error(self, error: str):
+        self.errors[error] = self.errors.get(error, 0) + 1
+
+    def to_dict(self) -> dict:
+        """Return the metrics as plain types, leaving out those not set."""
+        d = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if value is None or (f.name == MATCHES and not value):
+                continue
+            d[f.name] = dict(value) if isinstance(value, dict) else value
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "FileMetrics":
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in d.items() if k in names})
+
+
+class RunMetrics:
+    """The metrics of one annotate run, per file plus the run's total.
+    With a matches_sink (see ResultsSink and MATCHES_SCHEMA) MetaKB hits are streamed to it rather than held in memory.
+    """
+
+    def __init__(self, matches_sink=None):
+        self.files: dict[str, FileMetrics] = {}
+        self.total: dict = {}
+        self.matches_sink = matches_sink
+        if matches_sink:
+            self.total[MATCHES_FILE] = str(matches_sink.path)
+
+    def __getitem__(self, file_name: str) -> FileMetrics:
+        file_metrics = self.files.get(file_name)
+        if file_metrics is None:
+            file_metrics = self.files[file_name] = FileMetrics()
+        return file_metrics
+
+    def add_match(self, file_name: str, vrs_id: str, fmt: str, var: str):
+        """Record a MetaKB hit."""
+        file_metrics = self[file_name]
+        file_metrics.metakb_hits += 1
+        if self.matches_sink:
+            self.matches_sink.append(
+                {"file": file_name, "vrs_id": vrs_id, "fmt": fmt, "var": var}
+            )
+        else:
+            file_metrics.matches[vrs_id] = {"fmt": fmt, "var": var}
+
+    def finish(self, start_time: float, timestamp_str: str, cache: dict):
+        """Total the file metrics."""
+        self.total[TIMESTAMP] = timestamp_str
+        self.total[START_TIME] = start_time
+        self.total[END_TIME] = time.time()
+        self.total[ELAPSED_TIME] = self.total[END_TIME] - start_time
+        self.total[SUCCESSES] = sum(_.successes for _ in self.files.values())
+        self.total[ERRORS] = sum(sum(_.errors.values()) for _ in self.files.values())
+        self.total[CACHE] = cache
+
+    def to_dict(self) -> dict:
+        return {
+            TOTAL: dict(self.total),
+            **{k: v.to_dict() for k, v in self.files.items()},
+        }
+
+    def dump(self, path: pathlib.Path):
+        with open(path, "w") as stream:
+            yaml.dump(self.to_dict(), stream, Dumper=SafeDumper)
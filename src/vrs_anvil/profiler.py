@@ -0,0 +1,141 @@
+import collections
+import logging
+import multiprocessing
+import os
+import pathlib
+import sys
+import threading
+import time
+
+_logger = logging.getLogger("vrs_anvil.profiler")
+
+# seconds between samples, 100 a second costs a few percent of one core
+SAMPLE_INTERVAL = 0.01
+
+# the profiler running in this process, see active
+_active: "SamplingProfiler" = None
+
+
+def active() -> "SamplingProfiler":
+    """Return the profiler running in this process, None if there is none."""
+    return _active
+
+
+def _function(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class SamplingProfiler:
+    """Sample the stack of every thread of this process at a fixed interval, unlike cProfile which only sees the thread it was started on.
+    Stacks are counted as "process/thread;outer;...;inner" strings, i.e. the collapsed format read by flamegraph.pl and speedscope.
+    Worker processes hand their stacks to the parent's profiler with take and merge, see vrs_anvil.translator.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self.start_time = None
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="SamplingProfiler", daemon=True
+        )
+
+    def start(self) -> "SamplingProfiler":
+        global _active
+        _active = self
+        self.start_time = time.monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        global _active
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.monotonic() - self.start_time
+        if _active is self:
+            _active = None
+
+    def take(self) -> collections.Counter:
+        """Return the stacks sampled since the last take and forget them."""
+        with self._lock:
+            stacks, self.stacks = self.stacks, collections.Counter()
+        return stacks
+
+    def merge(self, stacks: dict):
+        """Add stacks sampled elsewhere, e.g. by a worker process."""
+        with self._lock:
+            self.stacks.update(stacks)
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        process_name = multiprocessing.current_process().name
+        while not self._stop.wait(self.interval):
+            names = {_.ident: _.name for _ in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                functions = []
+                while frame is not None:
+                    functions.append(_function(frame))
+                    frame = frame.f_back
+                functions.append(f"{process_name}/{names.get(ident, ident)}")
+                sampled.append(";".join(reversed(functions)))
+            with self._lock:
+                self.stacks.update(sampled)
+            self.samples += 1
+
+    def _copy(self) -> collections.Counter:
+        with self._lock:
+            return collections.Counter(self.stacks)
+
+    def top(self, n: int = 25) -> tuple[list, list]:
+        """Return the n functions with the most samples at the top of a stack (self) and anywhere in a stack (cumulative)."""
+        own, cumulative = collections.Counter(), collections.Counter()
+        for stack, count in self._copy().items():
+            functions = stack.split(";")[1:]
+            own[functions[-1]] += count
+            # count recursive functions once per stack
+            for function in set(functions):
+                cumulative[function] += count
+        return own.most_common(n), cumulative.most_common(n)
+
+    def summary(self, n: int = 25) -> str:
+        """Return a top n report, sample counts are also given as a percentage of all thread samples."""
+        own, cumulative = self.top(n)
+        stacks = self._copy()
+        total = sum(stacks.values()) or 1
+        threads = collections.Counter()
+        for stack, count in stacks.items():
+            threads[stack.split(";", 1)[0]] += count
+        lines = [
+            f"{self.samples} samples of {len(threads)} threads every {self.interval}s over {self.elapsed:.1f}s, pid {os.getpid()}",
+            "",
+            "samples per thread:",
+            *[f"{count:>10} {thread}" for thread, count in threads.most_common()],
+        ]
+        for title, counts in [("self", own), ("cumulative", cumulative)]:
+            lines += ["", f"top {n} functions by {title} samples:"]
+            lines += [
+                f"{count:>10} {count / total:>7.1%} {function}"
+                for function, count in counts
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: pathlib.Path, suffix: str, n: int = 25) -> pathlib.Path:
+        """Write profile_<suffix>.txt with the summary and profile_<suffix>.folded with the collapsed stacks, return the summary path."""
+        directory = pathlib.Path(directory)
+        summary_path = directory / f"profile_{suffix}.txt"
+        with open(summary_path, "w") as f:
+            f.write(self.summary(n))
+        with open(directory / f"profile_{suffix}.folded", "w") as f:
+            for stack, count in self._copy().most_common():
+                f.write(f"{stack} {count}\n")
+        _logger.info(f"Profile written to {summary_path}")
+        return summary_path
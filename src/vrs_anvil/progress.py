@@ -0,0 +1,100 @@
+import logging
+import os
+import pathlib
+import time
+
+import yaml
+
+from vrs_anvil.checkpoint import ProgressTracker
+from vrs_anvil.metrics import RunMetrics, SafeDumper, SafeLoader
+from vrs_anvil.translator import cache_stats, queue_depths
+
+_logger = logging.getLogger("vrs_anvil.progress")
+
+
+def cache_hit_rates(stats: dict) -> dict:
+    """Return the hit rate of each cache tier in stats, see cache_stats."""
+    rates = {}
+    for tier, counters in stats.items():
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        if lookups:
+            rates[tier] = round(counters["hits"] / lookups, 4)
+    return rates
+
+
+class ProgressReporter:
+    """Periodically write a snapshot of an annotate run's throughput to a yaml file, see vrs_bulk ps.
+    Rates are given since the start of the run and over the interval since the previous snapshot.
+    """
+
+    def __init__(self, path: pathlib.Path, interval: float):
+        self.path = pathlib.Path(path)
+        self.interval = interval
+        self.start_time = time.monotonic()
+        self._previous = (self.start_time, 0, 0)
+        self._next_snapshot = self.start_time + interval
+
+    def maybe_write(self, metrics: RunMetrics, tracker: ProgressTracker):
+        """Write a snapshot if the interval has passed."""
+        if self.interval and time.monotonic() >= self._next_snapshot:
+            self.write(metrics, tracker)
+
+    def write(
+        self, metrics: RunMetrics, tracker: ProgressTracker, status: str = "running"
+    ):
+        """Atomically write a snapshot."""
+        now = time.monotonic()
+        lines = tracker.lines_read()
+        files = list(metrics.files.values())
+        successes = sum(_.successes for _ in files)
+        errors = sum(sum(_.errors.values()) for _ in files)
+        alleles = successes + errors
+        previous_time, previous_lines, previous_alleles = self._previous
+        elapsed, interval = now - self.start_time, now - previous_time
+
+        snapshot = {
+            "status": status,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "elapsed_time": round(elapsed, 1),
+            "lines": lines,
+            "alleles": alleles,
+            "successes": successes,
+            "errors": errors,
+            "metakb_hits": sum(_.metakb_hits for _ in files),
+            "lines_per_second": round(lines / elapsed, 1) if elapsed else 0,
+            "alleles_per_second": round(alleles / elapsed, 1) if elapsed else 0,
+            "recent_alleles_per_second": (
+                round((alleles - previous_alleles) / interval, 1) if interval else 0
+            ),
+            "cache_hit_rate": cache_hit_rates(cache_stats()),
+            "queue_depths": queue_depths(),
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as stream:
+            yaml.dump(snapshot, stream, Dumper=SafeDumper)
+        os.replace(tmp_path, self.path)
+        self._previous = (now, lines, alleles)
+        self._next_snapshot = now + self.interval
+        _logger.debug(f"Progress written to {self.path}")
+
+
+def load_progress(path: pathlib.Path) -> dict:
+    """Return a snapshot written by ProgressReporter."""
+    with open(path, "r") as stream:
+        return yaml.load(stream, Loader=SafeLoader)
+
+
+def format_progress(snapshot: dict) -> str:
+    """Return a one line summary of a snapshot."""
+    cache = ", ".join(
+        f"{tier} {rate:.0%}" for tier, rate in snapshot["cache_hit_rate"].items()
+    )
+    queues = ", ".join(
+        f"{name} {depth}" for name, depth in snapshot["queue_depths"].items()
+    )
+    return (
+        f"{snapshot['status']} {snapshot['elapsed_time']}s: lines: {snapshot['lines']} ({snapshot['lines_per_second']}/s), "
+        f"alleles: {snapshot['alleles']} ({snapshot['alleles_per_second']}/s, recent {snapshot['recent_alleles_per_second']}/s), "
+        f"errors: {snapshot['errors']}, metakb_hits: {snapshot['metakb_hits']}, cache hit rate: {cache or 'NA'}, queues: {queues or 'NA'}"
+    )
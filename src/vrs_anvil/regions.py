@@ -0,0 +1,139 @@
+import gzip
+import os
+import pathlib
+import struct
+from typing import Optional
+
+from pysam import TabixFile
+
+# see https://samtools.github.io/hts-specs/tabix.pdf and https://samtools.github.io/hts-specs/CSIv1.pdf
+TBI_MAGIC = b"TBI\x01"
+CSI_MAGIC = b"CSI\x01"
+# the tabix linear index has an entry per 16kb window
+TBI_SHIFT = 14
+
+
+def index_path(vcf_path) -> Optional[str]:
+    """Return the .tbi or .csi index of a bgzipped vcf, following symlinks into the work directory, or None."""
+    vcf_path = pathlib.Path(vcf_path).resolve()
+    for suffix in [".tbi", ".csi"]:
+        _ = f"{vcf_path}{suffix}"
+        if os.path.exists(_):
+            return _
+    return None
+
+
+def parse_region(region: str) -> tuple[str, int, Optional[int]]:
+    """Split chrom:start[-end] (1-based, inclusive) into its parts, contig names may contain ':'."""
+    contig, _, span = region.rpartition(":")
+    start, _, end = span.partition("-")
+    return contig, int(start), int(end) if end else None
+
+
+def _tbi_offsets(data: bytes) -> list[list[tuple[int, int]]]:
+    """Read the linear index of each reference, the compressed offset of every 16kb window."""
+    (n_ref,) = struct.unpack_from("<i", data, 4)
+    (l_nm,) = struct.unpack_from("<i", data, 32)
+    i = 36 + l_nm
+    references = []
+    for _ in range(n_ref):
+        (n_bin,) = struct.unpack_from("<i", data, i)
+        i += 4
+        for _ in range(n_bin):
+            (n_chunk,) = struct.unpack_from("<i", data, i + 4)
+            i += 8 + 16 * n_chunk
+        (n_intv,) = struct.unpack_from("<i", data, i)
+        i += 4
+        ioffsets = struct.unpack_from(f"<{n_intv}Q", data, i)
+        i += 8 * n_intv
+        # the compressed offset of a virtual file offset is its upper 48 bits
+        references.append(
+            [((k << TBI_SHIFT) + 1, ioff >> 16) for k, ioff in enumerate(ioffsets)]
+        )
+    return references
+
+
+def _csi_offsets(data: bytes) -> list[list[tuple[int, int]]]:
+    """Read the bins of each reference, the compressed offset of the first record overlapping each bin's start."""
+    min_shift, depth, l_aux = struct.unpack_from("<iii", data, 4)
+    i = 16 + l_aux
+    (n_ref,) = struct.unpack_from("<i", data, i)
+    i += 4
+    pseudo_bin = ((1 << 3 * depth + 3) - 1) // 7 + 1
+    references = []
+    for _ in range(n_ref):
+        (n_bin,) = struct.unpack_from("<i", data, i)
+        i += 4
+        points = {}
+        for _ in range(n_bin):
+            bin_, loffset, n_chunk = struct.unpack_from("<IQi", data, i)
+            i += 16 + 16 * n_chunk
+            if bin_ == pseudo_bin:
+                continue
+            # htslib merges small bins into their parents, so use bins of every level
+            level = next(_ for _ in range(depth, -1, -1) if bin_ >= _first_bin(_))
+            position = (
+                (bin_ - _first_bin(level)) << min_shift + 3 * (depth - level)
+            ) + 1
+            points[position] = min(points.get(position, loffset >> 16), loffset >> 16)
+        references.append(sorted(points.items()))
+    return references
+
+
+def _first_bin(level: int) -> int:
+    """The first bin number of a level of the binning scheme."""
+    return ((1 << 3 * level) - 1) // 7
+
+
+def index_offsets(index_path: str) -> list[list[tuple[int, int]]]:
+    """Return the (1-based position, compressed offset) points of each reference in a .tbi or .csi index."""
+    with gzip.open(index_path, "rb") as f:
+        data = f.read()
+    if data.startswith(TBI_MAGIC):
+        return _tbi_offsets(data)
+    if data.startswith(CSI_MAGIC):
+        return _csi_offsets(data)
+    raise ValueError(f"{index_path} is not a tabix or csi index")
+
+
+def split_regions(vcf_path: str, n: int) -> list[list[str]]:
+    """Split an indexed vcf into at most n shards with about the same number of compressed bytes.
+    Each shard is a list of chrom:start[-end] regions, together they cover every record once by its POS.
+    """
+    _index_path = index_path(vcf_path)
+    assert _index_path, f"{vcf_path} is not indexed, run tabix -p vcf {vcf_path}"
+    with TabixFile(str(vcf_path), index=_index_path) as tbx:
+        contigs = list(tbx.contigs)
+
+    # records are sorted, so compressed offsets increase across contigs in index order,
+    # the first region of a contig starts at 1 so none of its records are missed
+    points = [
+        (contig, position if k else 1, offset)
+        for contig, offsets in zip(contigs, index_offsets(_index_path))
+        for k, (position, offset) in enumerate(offsets)
+    ]
+    if not points:
+        return []
+    first_offset = points[0][2]
+    total_bytes = max(os.path.getsize(vcf_path) - first_offset, 1)
+
+    # (contig, start, stop) per shard, stop is the next point's position or None for the end of the contig
+    shards = [[] for _ in range(n)]
+    for j, (contig, position, offset) in enumerate(points):
+        regions = shards[min(n - 1, (offset - first_offset) * n // total_bytes)]
+        stop = None
+        if j + 1 < len(points) and points[j + 1][0] == contig:
+            stop = points[j + 1][1]
+        # extend the shard's last region rather than adding its neighbour
+        if regions and regions[-1][0] == contig and regions[-1][2] == position:
+            regions[-1] = (contig, regions[-1][1], stop)
+        else:
+            regions.append((contig, position, stop))
+    return [
+        [
+            f"{contig}:{start}-{stop - 1}" if stop else f"{contig}:{start}"
+            for contig, start, stop in regions
+        ]
+        for regions in shards
+        if regions
+    ]
@@ -0,0 +1,87 @@
+import logging
+import pathlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from vrs_anvil.translator import VCFItem
+
+_logger = logging.getLogger("vrs_anvil.results")
+
+RESULTS_SCHEMA = pa.schema(
+    [
+        ("file", pa.string()),
+        ("line_number", pa.int64()),
+        ("var", pa.string()),
+        ("vrs_id", pa.string()),
+        ("metakb_hit", pa.bool_()),
+        ("error", pa.string()),
+    ]
+)
+
+
+class ResultsSink:
+    """Stream every translation to a parquet or arrow (IPC) file, one row per allele, or rows of another schema with append.
+    Rows are buffered in columns and written as a record batch every batch_size rows, so memory stays bounded.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        fmt: str = "parquet",
+        batch_size: int = 100000,
+        schema: pa.Schema = RESULTS_SCHEMA,
+    ):
+        self.path = pathlib.Path(path)
+        self.batch_size = batch_size
+        self.schema = schema
+        self.rows = 0
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(str(self.path), schema)
+        elif fmt == "arrow":
+            self._writer = pa.ipc.new_file(str(self.path), schema)
+        else:
+            raise ValueError(f"Unknown results format {fmt}")
+        self._columns = {name: [] for name in schema.names}
+        self._buffered = 0
+
+    def write(self, item: VCFItem, metakb_hit: bool = False):
+        """Add a translated (or failed) item."""
+        self.append(
+            {
+                "file": str(item.file_name),
+                "line_number": item.line_number,
+                "var": item.var,
+                "vrs_id": None if item.error else item.result,
+                "metakb_hit": metakb_hit,
+                "error": item.error,
+            }
+        )
+
+    def append(self, row: dict):
+        """Add a row with a value for each column of the schema."""
+        for name, column in self._columns.items():
+            column.append(row[name])
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        self._writer.write_batch(pa.record_batch(self._columns, schema=self.schema))
+        self.rows += self._buffered
+        self._columns = {name: [] for name in self.schema.names}
+        self._buffered = 0
+
+    def close(self):
+        """Write the buffered rows and finalize the file."""
+        self._flush()
+        self._writer.close()
+        _logger.info(f"Wrote {self.rows} results to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+_logger = logging.getLogger("vrs_anvil.scatter")
+
+# seconds between checks for finished children
+POLL_INTERVAL = 1.0
+
+
+def job_size(vcf_file: str, shards: int = 1) -> int:
+    """Return the bytes of vcf_file a job annotates, an even share of the file per region shard, 0 if it is not local."""
+    try:
+        return os.path.getsize(vcf_file) // shards
+    except OSError:
+        return 0
+
+
+@dataclass
+class ScatterJob:
+    """A child annotate command, record is its entry in scattered_processes_<timestamp>.yaml"""
+
+    command: str
+    size: int
+    record: dict = field(default_factory=dict)
+    process: Any = None
+
+
+def run_scattered(
+    jobs: list[ScatterJob],
+    max_processes: int,
+    start: Callable[[str], Any],
+    on_change: Callable[[], None] = None,
+) -> list[ScatterJob]:
+    """Run the jobs' commands with start, at most max_processes at once and largest first, until all have exited.
+    on_change is called whenever a job starts or exits, e.g. to rewrite the scattered processes file.
+    On KeyboardInterrupt the running children are terminated and the queued jobs are not started.
+    """
+    queued = sorted(jobs, key=lambda _: _.size, reverse=True)
+    running: list[ScatterJob] = []
+    for job in queued:
+        job.record.update(pid=None, status="queued")
+    try:
+        while queued or running:
+            changed = False
+            for job in list(running):
+                if job.process.poll() is not None:
+                    running.remove(job)
+                    job.record["status"] = "exited"
+                    changed = True
+            while queued and len(running) < max_processes:
+                job = queued.pop(0)
+                job.process = start(job.command)
+                job.record.update(pid=job.process.pid, status="running")
+                _logger.info(f"Started pid {job.process.pid}: {job.command}")
+                running.append(job)
+                changed = True
+            if changed and on_change:
+                on_change()
+            if running:
+                time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        _logger.warning(
+            f"Interrupted, terminating {len(running)} children, {len(queued)} jobs not started"
+        )
+        for job in running:
+            job.process.terminate()
+        for job in running:
+            job.process.wait()
+            job.record["status"] = "terminated"
+        if on_change:
+            on_change()
+        raise
+    return jobs
@@ -0,0 +1,113 @@
+import multiprocessing
+import threading
+import time
+from typing import Iterable, Iterator
+
+# off by default, start() and stop() then do no more than check this flag
+enabled = False
+
+# per worker {stage: [seconds, calls]}, each thread only updates its own so the hot path takes no lock
+_workers: dict[str, dict[str, list]] = {}
+_workers_lock = threading.Lock()
+_local = threading.local()
+_generation = 0
+
+
+def enable(on: bool = True):
+    """Turn stage timing on or off for this process."""
+    global enabled
+    enabled = on
+
+
+def reset():
+    """Forget the timings recorded so far."""
+    global _generation
+    with _workers_lock:
+        _workers.clear()
+        _generation += 1
+
+
+def _worker_name() -> str:
+    return f"{multiprocessing.current_process().name}/{threading.current_thread().name}"
+
+
+def record(stage: str, seconds: float):
+    """Add a call of seconds to the current worker's total for stage."""
+    stats = getattr(_local, "stats", None)
+    if stats is None or _local.generation != _generation:
+        stats = _local.stats = {}
+        _local.generation = _generation
+        with _workers_lock:
+            _workers[_worker_name()] = stats
+    totals = stats.get(stage)
+    if totals is None:
+        totals = stats[stage] = [0.0, 0]
+    totals[0] += seconds
+    totals[1] += 1
+
+
+def start() -> float:
+    """Return a start time to pass to stop, 0 if timing is off."""
+    return time.perf_counter() if enabled else 0.0
+
+
+def stop(stage: str, started: float):
+    """Record the time since start() against stage."""
+    if enabled:
+        record(stage, time.perf_counter() - started)
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """Yield the items of iterable, recording the time taken to produce each against stage."""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(stage, time.perf_counter() - started)
+        yield item
+
+
+def snapshot() -> dict:
+    """Return {worker: {stage: {seconds, calls}}} for this process."""
+    with _workers_lock:
+        workers = list(_workers.items())
+    return {
+        worker: {
+            stage: {"seconds": seconds, "calls": calls}
+            for stage, (seconds, calls) in list(stats.items())
+        }
+        for worker, stats in workers
+    }
+
+
+def summarize(workers: dict) -> dict:
+    """Return {stage: {seconds, calls, workers: {worker: {seconds, calls}}}} from a snapshot."""
+    stages = {}
+    for worker, stats in sorted(workers.items()):
+        for stage, totals in stats.items():
+            summary = stages.setdefault(
+                stage, {"seconds": 0.0, "calls": 0, "workers": {}}
+            )
+            summary["seconds"] += totals["seconds"]
+            summary["calls"] += totals["calls"]
+            summary["workers"][worker] = {
+                "seconds": round(totals["seconds"], 6),
+                "calls": totals["calls"],
+            }
+    for summary in stages.values():
+        summary["seconds"] = round(summary["seconds"], 6)
+    return stages
+
+
+def merge_summaries(summaries: list[dict]) -> dict:
+    """Sum the stage totals of several summaries, e.g. of scattered runs, leaving out the per worker breakdown."""
+    merged = {}
+    for summary in summaries:
+        for stage, totals in summary.items():
+            stage_totals = merged.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            stage_totals["seconds"] += totals["seconds"]
+            stage_totals["calls"] += totals["calls"]
+    return merged
@@ -1,48 +1,104 @@
+import collections
+import itertools
 import logging
+import multiprocessing
+import os
 import queue
+import sys
 import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import NamedTuple, Generator, Any, Optional
+from typing import NamedTuple, Generator, Any, Optional, Callable
 
 from pydantic import BaseModel
 
-from vrs_anvil import caching_allele_translator_factory
+import vrs_anvil
+from vrs_anvil import (
+    caching_allele_translator_factory,
+    CachingAlleleTranslator,
+    allele_translator_cache_stats,
+    sum_cache_stats,
+    timing,
+)
+from vrs_anvil import profiler
 
 _logger = logging.getLogger("vrs_anvil.translator")
 
+# default number of VCFItems shipped to a worker per work unit
+BATCH_SIZE = 1000
+
+# number of recently translated expressions remembered by the dedupe stage
+DEDUPE_CACHE_SIZE = 100_000
+
+# number of duplicates the dedupe stage holds back before passing them on to the workers
+DEDUPE_MAX_HELD = 10_000
+
+# priority of the end of stream sentinel, sorts after every batch
+END_OF_STREAM = sys.maxsize
+
+# per process translators, one per thread, see _init_process_worker
+_process_translators: list[CachingAlleleTranslator] = []
+
+# threads translating a batch in a worker process, None when it has a single translator
+_process_threads: ThreadPoolExecutor = None
+
+# exception raised by _init_process_worker, re-raised by the worker's tasks so the parent sees it rather than BrokenProcessPool
+_process_init_error: Exception = None
+
+# latest cache counters reported by each worker process, by pid
+_process_cache_stats: dict[int, dict] = {}
+
+# latest stage timings reported by each worker process, by pid, see vrs_anvil.timing
+_process_timing: dict[int, dict] = {}
+
+# batches waiting in the running translator's queues, by queue name, see queue_depths
+_queue_depths: dict[str, Callable[[], int]] = {}
+
 
 class WorkerThread(threading.Thread):
-    """Read from the task queue, process the item, with local translator and write the result to the result queue."""
+    """Read a batch from the task queue, process its items with local translator and write the batch of results to the result queue."""
 
     def __init__(self, task_queue, result_queue, normalize):
         super().__init__(daemon=True)
         self.task_queue = task_queue
         self.result_queue = result_queue
+        self.normalize = normalize
         self.translator = caching_allele_translator_factory(normalize=normalize)
-        self.busy = False
 
     def run(self):
-        while True:
-            try:
+        prioritized_item = None
+        try:
+            while True:
                 prioritized_item = self.task_queue.get()
-                item: VCFItem = prioritized_item.item
-                if item is None:
+                batch: list[VCFItem] = prioritized_item.item
+                if batch is None:
+                    self.task_queue.task_done()
                     break  # Signal to exit the thread
 
-                self.busy = True
-                allele_id = self.translator.translate_from(fmt=item.fmt, var=item.var)
-                _ = item._asdict()
-                _["result"] = allele_id
-                result = VCFItem(**_)
-                self.result_queue.put(PrioritizedItem(1, result))
+                # translation errors are captured per item, see _translate_item
+                results = [_translate_item(self.translator, item) for item in batch]
+                self.result_queue.put(
+                    PrioritizedItem(prioritized_item.priority, results)
+                )
+                prioritized_item = None
+                self.task_queue.task_done()
 
-                self.busy = False
+        except Exception as exc:
+            _logger.exception(f"{self.name} died {exc}")
+            if prioritized_item is not None and prioritized_item.item is not None:
+                # hand back the batch in flight as errors rather than losing it
+                error = exc.__class__.__name__
+                results = [item._replace(error=error) for item in prioritized_item.item]
+                self.result_queue.put(
+                    PrioritizedItem(prioritized_item.priority, results)
+                )
                 self.task_queue.task_done()
+            # ask the caller to replace this worker
+            self.result_queue.put(PrioritizedItem(END_OF_STREAM, self))
+            return
 
-            except Exception as exc:
-                _logger.exception(f"{self.name} error {exc}")
-                self.busy = False
-                break
+        # tell the caller this worker will not produce any more results
+        self.result_queue.put(PrioritizedItem(END_OF_STREAM, None))
 
 
 class VCFItem(NamedTuple):
@@ -60,6 +116,8 @@ class VCFItem(NamedTuple):
     """identifier for the item"""
     result: Any = None
     """identifier for the item"""
+    error: str = None
+    """class name of the exception raised translating the item, if any"""
 
 
 @dataclass(order=True)
@@ -71,40 +129,331 @@ class PrioritizedItem:
 
 
 class Translator(BaseModel):
-    """A class to run the translation in either threaded or non-threaded fashion."""
+    """A class to run the translation in a non-threaded, threaded or multi-process fashion."""
 
     normalize: Optional[bool] = False
 
+    mode: Optional[str] = "thread"
+    """How to run num_threads > 1 workers: "thread" or "process" """
+
+    batch_size: Optional[int] = BATCH_SIZE
+    """Number of items per work unit shipped to a worker"""
+
+    preserve_order: Optional[bool] = False
+    """Threaded results are yielded in input order rather than completion order"""
+
+    deduplicate: Optional[bool] = False
+    """Translate each distinct expression once, see deduplicating_translator"""
+
+    threads_per_process: Optional[int] = 1
+    """Threads translating in each worker process when mode is "process" """
+
     def translate_from(
         self, generator: Generator[VCFItem, None, None], num_threads: int = 8
     ) -> Generator[VCFItem, None, None]:
-        if num_threads > 1:
-            return threaded_translator(generator, num_threads, self.normalize)
+        if self.deduplicate:
+            return deduplicating_translator(
+                generator, lambda _: self._translate_from(_, num_threads)
+            )
+        return self._translate_from(generator, num_threads)
+
+    def _translate_from(
+        self, generator: Generator[VCFItem, None, None], num_threads: int
+    ) -> Generator[VCFItem, None, None]:
+        if num_threads > 1 and self.mode == "process":
+            return process_translator(
+                generator,
+                num_threads,
+                self.normalize,
+                self.batch_size,
+                threads_per_process=self.threads_per_process,
+            )
+        elif num_threads > 1:
+            return threaded_translator(
+                generator,
+                num_threads,
+                self.normalize,
+                self.batch_size,
+                preserve_order=self.preserve_order,
+            )
         else:
             return inline_translator(generator, self.normalize)
 
 
+def _translate_item(tlr: CachingAlleleTranslator, item: VCFItem) -> VCFItem:
+    """Translate a single item, return a copy of the item with either the result or the error set."""
+    if item.result is not None or item.error is not None:
+        # already resolved, e.g. passed through by deduplicating_translator
+        return item
+    try:
+        allele_id = tlr.translate_from(fmt=item.fmt, var=item.var)
+    except Exception as exc:
+        _logger.error(f"{item.var} {exc.__class__.__name__}: {exc}")
+        return item._replace(error=exc.__class__.__name__)
+    return item._replace(result=allele_id)
+
+
+def _batched(
+    generator: Generator[VCFItem, None, None], batch_size: int
+) -> Generator[list[VCFItem], None, None]:
+    """Group the items of a generator into lists of at most batch_size items."""
+    iterator = iter(generator)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
 def inline_translator(
     generator: Generator[VCFItem, None, None], normalize: bool = False
 ) -> Generator[VCFItem, None, None]:
     """A generator that runs the translation in a non-threaded fashion."""
     tlr = caching_allele_translator_factory(normalize=normalize)
     for item in generator:
-        allele_id = tlr.translate_from(fmt=item.fmt, var=item.var)
-        _ = item._asdict()
-        _["result"] = allele_id
-        yield VCFItem(**_)
+        yield _translate_item(tlr, item)
+
+
+def deduplicating_translator(
+    generator: Generator[VCFItem, None, None],
+    translate_from: Callable[[Generator], Generator[VCFItem, None, None]],
+    cache_size: int = DEDUPE_CACHE_SIZE,
+    max_held: int = DEDUPE_MAX_HELD,
+) -> Generator[VCFItem, None, None]:
+    """Coalesce items with an identical var so each expression is translated once, in flight or recently seen.
+    Only the first item for a var is passed to translate_from, its result (or error) is fanned back out to
+    every other item for that var. Duplicates are yielded after the translated item, so order is not preserved.
+    At most max_held duplicates are held back at a time, beyond that they are passed to translate_from
+    (recently seen ones already resolved, see _translate_item) so its bounded queues keep the reader in check.
+    """
+    lock = threading.Lock()
+    translated = collections.OrderedDict()  # var -> (result, error), least recent first
+    in_flight = {}  # var -> duplicate items waiting on the translation of var
+    resolved = collections.deque()  # duplicates of a translated var, ready to yield
+    counts = collections.Counter()
+
+    def unique_items():
+        # runs wherever translate_from consumes its input, e.g. the reader thread
+        for item in generator:
+            with lock:
+                counts["items"] += 1
+                held = counts["held"] < max_held
+                if item.var in translated:
+                    translated.move_to_end(item.var)
+                    result, error = translated[item.var]
+                    item = item._replace(result=result, error=error)
+                    if held:
+                        resolved.append(item)
+                    else:
+                        counts["passed"] += 1
+                elif item.var in in_flight:
+                    if held:
+                        in_flight[item.var].append(item)
+                    else:
+                        counts["passed"] += 1
+                else:
+                    in_flight[item.var] = []
+                    held = False
+                if held:
+                    counts["held"] += 1
+                    continue
+            yield item
+
+    for result in translate_from(unique_items()):
+        with lock:
+            duplicates = in_flight.pop(result.var, [])
+            translated[result.var] = (result.result, result.error)
+            if len(translated) > cache_size:
+                translated.popitem(last=False)
+            ready = list(resolved)
+            resolved.clear()
+            counts["held"] -= len(duplicates) + len(ready)
+            counts["translated"] += 1
+        yield result
+        for item in duplicates:
+            yield item._replace(result=result.result, error=result.error)
+        yield from ready
+
+    # duplicates read after the last translation was yielded
+    yield from resolved
+    _logger.info(
+        f"deduplicating_translator: translated {counts['translated'] - counts['passed']} of {counts['items']} items"
+    )
+
+
+def _init_process_worker(
+    manifest,
+    normalize: bool,
+    timed: bool,
+    threads_per_process: int = 1,
+    profiled: bool = False,
+):
+    """Process pool initializer, each worker process holds a translator per thread.
+    When the parent is profiled (see vrs_bulk --profile) so is the worker, its stacks are returned with each batch.
+    An exception is logged and kept for _check_process_worker, raising it here would only break the pool.
+    """
+    global _process_translators, _process_threads, _process_init_error
+    try:
+        vrs_anvil.manifest = manifest
+        timing.enable(timed)
+        if profiled:
+            profiler.SamplingProfiler().start()
+        _process_translators = [
+            caching_allele_translator_factory(normalize=normalize)
+            for _ in range(threads_per_process)
+        ]
+        if threads_per_process > 1:
+            _process_threads = ThreadPoolExecutor(
+                threads_per_process, thread_name_prefix="translator"
+            )
+    except Exception as exc:
+        _logger.exception(f"Process worker {os.getpid()} failed to start: {exc}")
+        _process_init_error = exc
+
+
+def _check_process_worker() -> int:
+    """Raise the exception the worker's initializer failed with, if any, else return the worker's pid."""
+    if _process_init_error is not None:
+        raise _process_init_error
+    return os.getpid()
+
+
+def _translate_items(
+    tlr: CachingAlleleTranslator, items: list[VCFItem]
+) -> list[VCFItem]:
+    return [_translate_item(tlr, item) for item in items]
+
+
+def _translate_batch(
+    batch: list[VCFItem],
+) -> tuple[list[VCFItem], int, dict, dict, dict]:
+    """Translate a batch of items in a worker process, return the results with the process' cache counters, stage timings and profiled stacks.
+    With several threads the batch is split into a contiguous chunk per thread, keeping the results in input order.
+    """
+    _check_process_worker()
+    if _process_threads is None:
+        results = _translate_items(_process_translators[0], batch)
+    else:
+        size = -(-len(batch) // len(_process_translators))
+        chunks = _batched(batch, size)
+        results = [
+            item
+            for chunk in _process_threads.map(
+                _translate_items, _process_translators, chunks
+            )
+            for item in chunk
+        ]
+    worker_profiler = profiler.active()
+    stacks = worker_profiler.take() if worker_profiler else {}
+    return (
+        results,
+        os.getpid(),
+        allele_translator_cache_stats(),
+        timing.snapshot(),
+        stacks,
+    )
+
+
+def _process_results(future) -> list[VCFItem]:
+    """Unpack a _translate_batch future, recording the worker's cache counters, stage timings and profiled stacks."""
+    results, pid, stats, timings, stacks = future.result()
+    _process_cache_stats[pid] = stats
+    _process_timing[pid] = timings
+    parent_profiler = profiler.active()
+    if stacks and parent_profiler:
+        parent_profiler.merge(stacks)
+    return results
+
+
+def cache_stats() -> dict:
+    """Return the allele translator cache counters of this process and the last process pool's workers."""
+    return sum_cache_stats(
+        [allele_translator_cache_stats(), *_process_cache_stats.values()]
+    )
+
+
+def timing_stats() -> dict:
+    """Return the stage timings of this process' workers and the last process pool's workers, see vrs_anvil.timing."""
+    stats = timing.snapshot()
+    for timings in list(_process_timing.values()):
+        stats.update(timings)
+    return stats
+
+
+def reset_stats():
+    """Forget the cache counters and stage timings reported by the last process pool's workers."""
+    _process_cache_stats.clear()
+    _process_timing.clear()
+
+
+def queue_depths() -> dict:
+    """Return the number of batches in each queue of the running translator."""
+    return {name: depth() for name, depth in list(_queue_depths.items())}
+
+
+def process_translator(
+    generator: Generator[VCFItem, None, None],
+    num_worker_processes: int,
+    normalize: bool = False,
+    batch_size: int = BATCH_SIZE,
+    threads_per_process: int = 1,
+) -> Generator[VCFItem, None, None]:
+    """A generator that runs the translation in a pool of processes, results are yielded in input order.
+    Each process translates its batches with threads_per_process threads.
+    """
+    # spawn rather than fork, the parent has live reader/progress bar threads
+    executor = ProcessPoolExecutor(
+        max_workers=num_worker_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_process_worker,
+        initargs=(
+            vrs_anvil.manifest,
+            normalize,
+            timing.enabled,
+            threads_per_process,
+            profiler.active() is not None,
+        ),
+    )
+    reset_stats()
+    # keep every worker busy while bounding the number of batches held in memory
+    max_pending = num_worker_processes * 2
+    pending = collections.deque()
+    _queue_depths.clear()
+    _queue_depths["pending"] = pending.__len__
+    try:
+        # start the workers, running their initializers, before reading the first item
+        for started in [
+            executor.submit(_check_process_worker) for _ in range(num_worker_processes)
+        ]:
+            started.result()
+        for batch in _batched(generator, batch_size):
+            pending.append(executor.submit(_translate_batch, batch))
+            if len(pending) >= max_pending:
+                yield from _process_results(pending.popleft())
+        while pending:
+            yield from _process_results(pending.popleft())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def threaded_translator(
     generator: Generator[VCFItem, None, None],
     num_worker_threads: int,
     normalize: bool = False,
+    batch_size: int = 1,
+    preserve_order: bool = False,
+    reorder_window: int = None,
 ) -> Generator[VCFItem, None, None]:
-    """A generator that runs the translation in a threaded fashion."""
+    """A generator that runs the translation in a threaded fashion.
+    Items travel between the reader, workers and the caller in batches of batch_size, amortizing queue overhead.
+    With preserve_order, results are yielded in the order they were read, i.e. (file_name, line_number) order,
+    and the reader is held to at most reorder_window batches (default 4 per worker) ahead of the caller,
+    bounding the memory used to buffer out of order results.
+    """
     task_queue = queue.PriorityQueue(maxsize=num_worker_threads * 2)
     result_queue = queue.PriorityQueue(maxsize=num_worker_threads * 2)
 
+    window = None
+    if preserve_order:
+        window = threading.BoundedSemaphore(reorder_window or num_worker_threads * 4)
+
     # Start worker threads
     worker_threads = [
         WorkerThread(task_queue, result_queue, normalize)
@@ -114,37 +463,73 @@ def threaded_translator(
         worker_thread.start()
 
     # Start the reader thread
+    reader_done = threading.Event()
+    reader_errors = []
 
     def reader_thread(_generator):
-        for item in _generator:
-            task_queue.put(PrioritizedItem(1, item))  # Default priority is 1
+        try:
+            # batches are numbered in read order, workers pick up the oldest batch first
+            for sequence, batch in enumerate(_batched(_generator, batch_size)):
+                if window:
+                    window.acquire()
+                task_queue.put(PrioritizedItem(sequence, batch))
+        except Exception as exc:
+            _logger.exception(f"reader error {exc}")
+            reader_errors.append(exc)
+        finally:
+            reader_done.set()
+            # one sentinel per worker, sorted after any batch still queued
+            for _ in worker_threads:
+                task_queue.put(PrioritizedItem(END_OF_STREAM, None))
 
     reader = threading.Thread(target=reader_thread, args=(generator,), daemon=True)
     reader.start()
 
-    # Main thread yields results
-    logged_already = []
-    c = 0
-    while True:
-        try:
-            prioritized_item = result_queue.get(
-                timeout=1
-            )  # Give the thread time to start
-            c += 1
-            yield prioritized_item.item
-            result_queue.task_done()
-        except queue.Empty:
-            reader_started = c > 0
-            if reader_started and all(
-                not worker_thread.busy for worker_thread in worker_threads
-            ):
-                _logger.info("All worker threads are idle, exiting.")
-                break
-            if not reader_started:
-                msg = "queue.Empty - Waiting for reader to start"
-            else:
-                msg = "queue.Empty - Waiting for worker threads to finish"
-
-            if msg not in logged_already:
-                _logger.info(msg)
-                logged_already.append(msg)
+    # Main thread yields results until every worker has signalled it is finished
+    reorder_buffer = {}
+    _queue_depths.clear()
+    _queue_depths["tasks"] = task_queue.qsize
+    _queue_depths["results"] = result_queue.qsize
+    _queue_depths["reorder"] = reorder_buffer.__len__
+    next_sequence = 0
+    finished_workers = 0
+    while finished_workers < len(worker_threads):
+        prioritized_item = result_queue.get()
+        result_queue.task_done()
+        if prioritized_item.item is None:
+            finished_workers += 1
+            continue
+        if isinstance(prioritized_item.item, WorkerThread):
+            dead_worker = prioritized_item.item
+            dead_worker.join()
+            worker_thread = WorkerThread(task_queue, result_queue, normalize)
+            worker_thread.start()
+            worker_threads[worker_threads.index(dead_worker)] = worker_thread
+            _logger.warning(
+                f"{dead_worker.name} died, replaced by {worker_thread.name}"
+            )
+            continue
+        if not preserve_order:
+            yield from prioritized_item.item
+            continue
+        # hold early batches until every batch read before them has been yielded
+        reorder_buffer[prioritized_item.priority] = prioritized_item.item
+        while next_sequence in reorder_buffer:
+            yield from reorder_buffer.pop(next_sequence)
+            next_sequence += 1
+            window.release()
+
+    if reorder_buffer:
+        _logger.error(
+            f"Batches {next_sequence}..{min(reorder_buffer) - 1} were lost, yielding the remaining {len(reorder_buffer)} batches"
+        )
+        for sequence in sorted(reorder_buffer):
+            yield from reorder_buffer.pop(sequence)
+
+    reader.join()
+    for worker_thread in worker_threads:
+        worker_thread.join()
+    assert reader_done.is_set(), "reader thread did not finish"
+    if reader_errors:
+        raise reader_errors[0]
+    _logger.info("Reader and worker threads finished, exiting.")
@@ -0,0 +1,158 @@
+import collections
+import logging
+import pathlib
+import threading
+
+import pysam
+
+from vrs_anvil.translator import VCFItem
+
+_logger = logging.getLogger("vrs_anvil.vcf_writer")
+
+VRS_ALLELE_IDS = "VRS_Allele_IDs"
+VRS_ERROR = "VRS_Error"
+
+# as written by vrs-python's VCFAnnotator, lookup.annotated_vcf_alleles looks for REF in the description
+VRS_ALLELE_IDS_HEADERS = {
+    True: f'##INFO=<ID={VRS_ALLELE_IDS},Number=R,Type=String,Description="The computed identifiers for the GA4GH VRS Alleles corresponding to the GT indexes of the REF and ALT alleles">',
+    False: f'##INFO=<ID={VRS_ALLELE_IDS},Number=A,Type=String,Description="The computed identifiers for the GA4GH VRS Alleles corresponding to the values in the ALT column">',
+}
+VRS_ERROR_HEADER = f'##INFO=<ID={VRS_ERROR},Number=.,Type=String,Description="If an error occurred computing a VRS Identifier, the error class">'
+
+
+class _PendingLine:
+    """A line waiting for the translation of its alleles."""
+
+    __slots__ = ["line", "remaining", "vrs_ids", "errors"]
+
+    def __init__(self, line: str, remaining: int):
+        self.line = line
+        self.remaining = remaining
+        self.vrs_ids = {}
+        self.errors = []
+
+
+class _AnnotatedVCF:
+    """The output stream of one vcf and its lines not yet written."""
+
+    def __init__(self, output_path: pathlib.Path):
+        self.output_path = output_path
+        self.stream = pysam.BGZFile(str(output_path), "wb")
+        self.pending: collections.OrderedDict[int, _PendingLine] = (
+            collections.OrderedDict()
+        )
+        self.read_all = False
+
+
+class AnnotatedVCFWriter:
+    """Write a bgzipped, tabix indexed copy of each vcf with VRS_Allele_IDs added to the INFO column.
+    Translations arrive in any order, a line is held until it and every line before it are translated.
+    """
+
+    def __init__(self, compute_for_ref: bool):
+        self.compute_for_ref = compute_for_ref
+        self._lock = threading.Lock()
+        self._vcfs: dict[str, _AnnotatedVCF] = {}
+
+    def start(self, file_name: str, header_lines: list[str], output_path):
+        """Open the annotated copy of a vcf and write its header."""
+        vcf = _AnnotatedVCF(pathlib.Path(output_path))
+        header = []
+        for line in header_lines:
+            line = line.rstrip("\n")
+            # replace the VRS fields of an already annotated vcf
+            if line.startswith(
+                (f"##INFO=<ID={VRS_ALLELE_IDS},", f"##INFO=<ID={VRS_ERROR},")
+            ):
+                continue
+            if line.startswith("#CHROM"):
+                header.extend(
+                    [VRS_ALLELE_IDS_HEADERS[self.compute_for_ref], VRS_ERROR_HEADER]
+                )
+            header.append(line)
+        vcf.stream.write(("\n".join(header) + "\n").encode())
+        with self._lock:
+            self._vcfs[file_name] = vcf
+
+    def read(self, file_name: str, line_number: int, line: str, items: int):
+        """Record a data line and the number of items it yielded."""
+        with self._lock:
+            vcf = self._vcfs[file_name]
+            vcf.pending[line_number] = _PendingLine(line, items)
+            if items == 0:
+                self._flush(file_name, vcf)
+
+    def done(self, item: VCFItem):
+        """Record the translation of an item."""
+        file_name = str(item.file_name)
+        with self._lock:
+            vcf = self._vcfs[file_name]
+            pending = vcf.pending[item.line_number]
+            pending.remaining -= 1
+            if item.error:
+                pending.errors.append(item.error)
+            else:
+                pending.vrs_ids[item.var] = item.result
+            if not pending.remaining:
+                self._flush(file_name, vcf)
+
+    def finish(self, file_name: str):
+        """Record that every line of a vcf has been read, it is closed once they are written."""
+        with self._lock:
+            vcf = self._vcfs[file_name]
+            vcf.read_all = True
+            self._flush(file_name, vcf)
+
+    def close(self):
+        """Close the annotated vcfs still open, e.g. if annotation stopped early."""
+        with self._lock:
+            for file_name, vcf in list(self._vcfs.items()):
+                _logger.error(
+                    f"{vcf.output_path} is incomplete, {len(vcf.pending)} lines were not translated"
+                )
+                self._close(file_name, vcf)
+
+    def _flush(self, file_name: str, vcf: _AnnotatedVCF):
+        """Write the translated lines at the head of the vcf, close it once all lines are written."""
+        while vcf.pending and not next(iter(vcf.pending.values())).remaining:
+            _, pending = vcf.pending.popitem(last=False)
+            vcf.stream.write(self._annotate(pending).encode())
+        if vcf.read_all and not vcf.pending:
+            self._close(file_name, vcf)
+            try:
+                pysam.tabix_index(str(vcf.output_path), preset="vcf", force=True)
+            except OSError as exc:
+                _logger.warning(
+                    f"Could not index {vcf.output_path}, is it sorted? {exc}"
+                )
+
+    def _close(self, file_name: str, vcf: _AnnotatedVCF):
+        vcf.stream.close()
+        del self._vcfs[file_name]
+        _logger.info(f"Wrote {vcf.output_path}")
+
+    def _annotate(self, pending: _PendingLine) -> str:
+        """Return the line with the VRS ids of its alleles, in REF (if computed) then ALT order, added to INFO."""
+        fields = pending.line.rstrip("\n").split("\t", 8)
+        # a record cut short of INFO gets its missing columns as "."
+        fields += ["."] * (8 - len(fields))
+        chrom, pos, _, ref, alts = fields[:5]
+        # replace the VRS fields of an already annotated vcf
+        info = [
+            _
+            for _ in fields[7].split(";")
+            if _ != "." and not _.startswith((f"{VRS_ALLELE_IDS}=", f"{VRS_ERROR}="))
+        ]
+        if pending.vrs_ids:
+            alleles = [_.strip() for _ in alts.split(",")]
+            if self.compute_for_ref:
+                alleles.insert(0, ref)
+            vrs_ids = [
+                pending.vrs_ids.get(f"{chrom}-{pos}-{ref}-{allele}") or "."
+                for allele in alleles
+            ]
+            info.append(f"{VRS_ALLELE_IDS}={','.join(vrs_ids)}")
+        if pending.errors:
+            info.append(f"{VRS_ERROR}={','.join(pending.errors)}")
+        fields[7] = ";".join(info) or "."
+        return "\t".join(fields) + "\n"
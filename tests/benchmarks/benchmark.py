@@ -0,0 +1,297 @@
+"""
+Benchmark the annotate translation pipeline on a synthetic VCF.
+
+    python -m tests.benchmarks.benchmark --manifest tests/fixtures/manifest.yaml --variants 10000 --output benchmark.json
+
+Each benchmark runs in a fresh process so its peak RSS is its own. Reports are JSON,
+compare two with `python -m tests.benchmarks.benchmark compare before.json after.json`.
+"""
+
+import json
+import multiprocessing
+import pathlib
+import platform
+import random
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import click
+import yaml
+
+import vrs_anvil
+from vrs_anvil import Manifest
+
+TEMPLATE_VCF = pathlib.Path(__file__).parent.parent / "fixtures/1kGP.chr1.1000.slim.vcf"
+
+BENCHMARKS = [
+    "vcf_items",
+    "translate_inline",
+    "translate_threaded",
+    "cache_miss",
+    "cache_hit",
+    "metakb_get",
+]
+
+BASES = "ACGT"
+
+
+def synthetic_vcf(
+    path: pathlib.Path,
+    variants: int,
+    samples: int = 1,
+    multiallelic_rate: float = 0.1,
+    seed: int = 0,
+    template: pathlib.Path = TEMPLATE_VCF,
+) -> pathlib.Path:
+    """Write a vcf of variants records, cycling through the sites (CHROM, POS, REF) of the template
+    so every REF matches the reference, with random inserted ALTs so almost every allele is distinct.
+    """
+    rng = random.Random(seed)
+    meta, sites = [], []
+    with open(template) as f:
+        for line in f:
+            if line.startswith("##"):
+                meta.append(line)
+            elif not line.startswith("#"):
+                chrom, pos, _, ref = line.split("\t", 4)[:4]
+                sites.append((chrom, pos, ref))
+    assert sites, f"no records in {template}"
+
+    columns = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
+    with open(path, "w") as f:
+        f.writelines(meta)
+        f.write("\t".join(columns + [f"S{_}" for _ in range(samples)]) + "\n")
+        for i in range(variants):
+            chrom, pos, ref = sites[i % len(sites)]
+            alt_count = rng.randint(2, 3) if rng.random() < multiallelic_rate else 1
+            alts = [
+                ref + "".join(rng.choices(BASES, k=rng.randint(1, 8)))
+                for _ in range(alt_count)
+            ]
+            genotypes = [
+                f"{rng.randint(0, alt_count)}|{rng.randint(0, alt_count)}"
+                for _ in range(samples)
+            ]
+            f.write(
+                "\t".join(
+                    [chrom, pos, ".", ref, ",".join(alts), ".", "PASS", ".", "GT"]
+                    + genotypes
+                )
+                + "\n"
+            )
+    return path
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of this process, ru_maxrss is in KB on linux and bytes on macOS."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _items(manifest: Manifest) -> list:
+    from vrs_anvil.annotator import _vcf_item_generator
+
+    return list(_vcf_item_generator(manifest))
+
+
+def _translate(manifest: Manifest, items: list, num_threads: int) -> list:
+    from vrs_anvil.translator import Translator
+
+    tlr = Translator(
+        normalize=manifest.normalize,
+        mode="thread",
+        batch_size=manifest.batch_size,
+    )
+    return list(tlr.translate_from(iter(items), num_threads=num_threads))
+
+
+def _disk_cache_hits() -> int:
+    return vrs_anvil.allele_translator_cache_stats().get("disk", {}).get("hits", 0)
+
+
+def run_benchmark(name: str, manifest: Manifest) -> dict:
+    """Run one benchmark in this process, return the variants it handled per second and the process' peak RSS."""
+    vrs_anvil.manifest = manifest
+    items = _items(manifest)
+    if name == "vcf_items":
+        start = time.perf_counter()
+        items = _items(manifest)
+    elif name in ["translate_inline", "translate_threaded", "cache_miss", "cache_hit"]:
+        num_threads = manifest.num_threads if name == "translate_threaded" else 1
+        if name == "cache_hit":
+            # fill the empty cache, so only hits are timed
+            _translate(manifest, items, 1)
+        hits = _disk_cache_hits()
+        start = time.perf_counter()
+        _translate(manifest, items, num_threads)
+        hits = _disk_cache_hits() - hits
+    elif name == "metakb_get":
+        vrs_ids = [_.result for _ in _translate(manifest, items, 1) if not _.error]
+        proxy = vrs_anvil.MetaKBProxy(
+            metakb_path=pathlib.Path(manifest.metakb_directory),
+            cache_path=pathlib.Path(manifest.cache_directory),
+        )
+        items = vrs_ids
+        start = time.perf_counter()
+        for vrs_id in vrs_ids:
+            proxy.get(vrs_id)
+    else:
+        raise ValueError(f"Unknown benchmark {name}")
+    seconds = time.perf_counter() - start
+    result = {
+        "variants": len(items),
+        "seconds": round(seconds, 3),
+        "variants_per_second": round(len(items) / seconds, 1) if seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if name in ["cache_miss", "cache_hit"]:
+        result["disk_cache_hits"] = hits
+    return result
+
+
+def benchmark_manifest(manifest: Manifest, name: str, vcf_path, work_dir) -> Manifest:
+    """Return the manifest a benchmark runs with, each has a cache directory of its own that starts empty."""
+    work_dir = pathlib.Path(work_dir)
+    cache_directory = work_dir / f"cache_{name}"
+    return manifest.model_copy(
+        update={
+            "vcf_files": [str(vcf_path)],
+            "limit": None,
+            "cache_enabled": name in ["cache_miss", "cache_hit", "metakb_get"],
+            "memory_cache_size": (
+                0 if name == "cache_hit" else manifest.memory_cache_size
+            ),
+            "vrs_lookup_table": None,
+            "cache_directory": str(cache_directory),
+            "work_directory": str(work_dir / "work"),
+            "state_directory": str(work_dir / "state"),
+            "disable_progress_bars": True,
+        }
+    )
+
+
+def run_benchmarks(
+    manifest: Manifest,
+    work_dir: pathlib.Path,
+    variants: int = 10000,
+    samples: int = 1,
+    multiallelic_rate: float = 0.1,
+    seed: int = 0,
+    benchmarks: list[str] = None,
+) -> dict:
+    """Generate a synthetic vcf in work_dir and run each benchmark on it in a fresh process, return the report."""
+    work_dir = pathlib.Path(work_dir)
+    for _ in ["work", "state"]:
+        (work_dir / _).mkdir(parents=True, exist_ok=True)
+    parameters = {
+        "variants": variants,
+        "samples": samples,
+        "multiallelic_rate": multiallelic_rate,
+        "seed": seed,
+        "num_threads": manifest.num_threads,
+        "batch_size": manifest.batch_size,
+        "normalize": manifest.normalize,
+    }
+    vcf_path = synthetic_vcf(
+        work_dir / "synthetic.vcf", variants, samples, multiallelic_rate, seed
+    )
+    results = {}
+    for name in benchmarks or BENCHMARKS:
+        _manifest = benchmark_manifest(manifest, name, vcf_path, work_dir)
+        shutil.rmtree(_manifest.cache_directory, ignore_errors=True)
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results[name] = executor.submit(run_benchmark, name, _manifest).result()
+        click.echo(f"{name}: {results[name]}", err=True)
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": multiprocessing.cpu_count(),
+        },
+        "parameters": parameters,
+        "results": results,
+    }
+
+
+def compare_reports(before: dict, after: dict) -> dict:
+    """Return the after / before ratio of variants_per_second and peak_rss_mb of the benchmarks in both reports."""
+    ratios = {}
+    for name, result in after["results"].items():
+        if name not in before["results"]:
+            continue
+        ratios[name] = {
+            key: round(result[key] / before["results"][name][key], 3)
+            for key in ["variants_per_second", "peak_rss_mb"]
+            if result.get(key) and before["results"][name].get(key)
+        }
+    return ratios
+
+
+@click.group(invoke_without_command=True)
+@click.option("--manifest", default="manifest.yaml", show_default=True)
+@click.option("--variants", default=10000, show_default=True)
+@click.option("--samples", default=1, show_default=True)
+@click.option("--multiallelic-rate", default=0.1, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option("--work-dir", default="work/benchmark", show_default=True)
+@click.option(
+    "--benchmark",
+    "benchmarks",
+    multiple=True,
+    type=click.Choice(BENCHMARKS),
+    help="Benchmarks to run, defaults to all",
+)
+@click.option(
+    "--output", default=None, help="Write the JSON report here, defaults to stdout"
+)
+@click.pass_context
+def cli(
+    ctx,
+    manifest,
+    variants,
+    samples,
+    multiallelic_rate,
+    seed,
+    work_dir,
+    benchmarks,
+    output,
+):
+    """Benchmark the translation pipeline on a synthetic VCF."""
+    if ctx.invoked_subcommand:
+        return
+    with open(manifest) as stream:
+        _manifest = Manifest.model_validate(yaml.safe_load(stream))
+    report = run_benchmarks(
+        _manifest,
+        pathlib.Path(work_dir),
+        variants,
+        samples,
+        multiallelic_rate,
+        seed,
+        list(benchmarks),
+    )
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        click.echo(json.dumps(report, indent=2))
+
+
+@cli.command("compare")
+@click.argument("before", type=click.Path(exists=True))
+@click.argument("after", type=click.Path(exists=True))
+def compare_cli(before, after):
+    """Print the after / before ratios of two reports."""
+    with open(before) as b, open(after) as a:
+        click.echo(json.dumps(compare_reports(json.load(b), json.load(a)), indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -5,6 +5,7 @@ from typing import Generator
 import pytest
 
 from tests.unit import validate_threaded_result
+from vrs_anvil.annotator import _vcf_item_generator
 from vrs_anvil.translator import VCFItem
 
 # see https://github.com/ga4gh/vrs-python/blob/main/tests/extras/test_allele_translator.py#L17
@@ -289,3 +290,26 @@ def test_gnomad_inline(translator, gnomad_csv, num_threads=1):
     ):
         c += 1
         validate_threaded_result(result_dict, validate_passthrough=False)
+
+
+@pytest.mark.parametrize(
+    "vcf_file",
+    [
+        "tests/fixtures/1kGP.chr1.1000.slim.vcf",
+        "tests/fixtures/chr1_multi_sample_vrs.vcf.gz",
+    ],
+)
+def test_vcf_readers(testing_manifest, vcf_file):
+    """The sites only pysam reader yields the same items as the text reader."""
+    testing_manifest.vcf_files = [str(pathlib.Path(vcf_file).resolve())]
+    testing_manifest.compute_for_ref = True
+
+    items = {}
+    for vcf_reader in ["text", "pysam"]:
+        testing_manifest.vcf_reader = vcf_reader
+        items[vcf_reader] = [
+            (_.var, _.line_number) for _ in _vcf_item_generator(testing_manifest)
+        ]
+
+    assert len(items["text"]) > 0, "should read items"
+    assert items["pysam"] == items["text"], "readers should agree"
@@ -0,0 +1,50 @@
+import itertools
+import os
+
+import yaml
+
+import vrs_anvil
+from vrs_anvil.annotator import AUTOTUNE, TOTAL, _vcf_item_generator, annotate_all
+from vrs_anvil.autotune import autotune, candidate_name, candidates
+
+
+def test_candidates():
+    """Ensure threads are tried up to twice the cores, processes up to the cores and splits up to twice the cores."""
+    assert candidates(1) == [("thread", 1, 1), ("thread", 2, 1)]
+    assert candidates(4) == [
+        ("thread", 1, 1),
+        ("thread", 2, 1),
+        ("thread", 4, 1),
+        ("thread", 8, 1),
+        ("process", 2, 1),
+        ("process", 2, 2),
+        ("process", 2, 4),
+        ("process", 4, 1),
+        ("process", 4, 2),
+    ]
+    assert candidate_name("process", 2, 4) == "process_2x4"
+
+
+def test_autotune(testing_manifest):
+    """Ensure the fastest candidate is set on the manifest, with the cache disabled only while calibrating."""
+    vrs_anvil.manifest = testing_manifest
+    items = list(itertools.islice(_vcf_item_generator(testing_manifest), 200))
+    tuning = autotune(testing_manifest, items, cpus=1)
+
+    assert tuning["rates"].keys() == {"thread_1", "thread_2"}
+    assert max(tuning["rates"], key=tuning["rates"].get) == (
+        f"{testing_manifest.translation_mode}_{testing_manifest.num_threads}"
+    )
+    assert testing_manifest.threads_per_process == 1
+    assert vrs_anvil.manifest is testing_manifest, "should restore the manifest"
+
+
+def test_annotate_autotune(testing_manifest, monkeypatch):
+    """Ensure annotate_all records the configuration it picked."""
+    monkeypatch.setattr(os, "cpu_count", lambda: 1)
+    testing_manifest.autotune = True
+    testing_manifest.autotune_variants = 100
+    with open(annotate_all(testing_manifest, max_errors=1000)) as stream:
+        tuning = yaml.safe_load(stream)[TOTAL][AUTOTUNE]
+    assert 0 < tuning["items"] <= 100
+    assert tuning["num_threads"] == testing_manifest.num_threads
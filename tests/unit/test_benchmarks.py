@@ -0,0 +1,45 @@
+import pysam
+
+from tests.benchmarks.benchmark import compare_reports, run_benchmarks, synthetic_vcf
+
+
+def test_synthetic_vcf(tmp_path):
+    """Ensure synthetic vcfs are reproducible and have the requested shape."""
+    path = synthetic_vcf(tmp_path / "a.vcf", 200, samples=3, multiallelic_rate=0.5)
+    with pysam.VariantFile(str(path)) as vcf:
+        records = list(vcf)
+        assert len(vcf.header.samples) == 3
+    assert len(records) == 200
+    multiallelic = sum(len(_.alts) > 1 for _ in records)
+    assert 50 < multiallelic < 150
+    assert all(alt.startswith(_.ref) for _ in records for alt in _.alts)
+
+    again = synthetic_vcf(tmp_path / "b.vcf", 200, samples=3, multiallelic_rate=0.5)
+    assert path.read_text() == again.read_text(), "should be seeded"
+
+
+def test_run_benchmarks(testing_manifest, tmp_path):
+    """Ensure a report has a rate and peak RSS for each benchmark run."""
+    report = run_benchmarks(
+        testing_manifest,
+        tmp_path / "benchmark",
+        variants=50,
+        benchmarks=["vcf_items", "translate_inline"],
+    )
+    assert report["parameters"]["variants"] == 50
+    for name in ["vcf_items", "translate_inline"]:
+        result = report["results"][name]
+        assert result["variants"] >= 50, "multiallelic lines yield several items"
+        assert result["peak_rss_mb"] > 0
+
+    ratios = compare_reports(report, report)
+    assert ratios["vcf_items"]["peak_rss_mb"] == 1
+
+
+def test_cache_hit_alone(testing_manifest, tmp_path):
+    """Ensure cache_hit times hits without relying on cache_miss running first."""
+    report = run_benchmarks(
+        testing_manifest, tmp_path / "benchmark", variants=50, benchmarks=["cache_hit"]
+    )
+    result = report["results"]["cache_hit"]
+    assert result["disk_cache_hits"] == result["variants"], "every lookup should hit"
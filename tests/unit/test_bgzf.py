@@ -0,0 +1,39 @@
+import gzip
+
+import pysam
+import pytest
+
+from vrs_anvil.bgzf import is_bgzf, open_bgzf
+
+
+@pytest.fixture
+def multi_block_vcf(tmp_path) -> str:
+    """Return a path to a bgzipped vcf spanning many BGZF blocks."""
+    vcf_path = tmp_path / "multi_block.vcf"
+    with open(vcf_path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\n")
+        for pos in range(1, 50_000):
+            f.write(
+                f"chr1\t{pos}\t.\tA\tT,é\n"
+            )  # multi-byte characters may straddle blocks
+    pysam.tabix_compress(str(vcf_path), str(vcf_path) + ".gz")
+    return str(vcf_path) + ".gz"
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_open_bgzf(multi_block_vcf, threads):
+    """Ensure the parallel reader returns the same lines as gzip."""
+    assert is_bgzf(multi_block_vcf)
+    with gzip.open(multi_block_vcf, "rt") as f:
+        expected = f.readlines()
+    with open_bgzf(multi_block_vcf, threads) as f:
+        assert f.readlines() == expected
+
+
+def test_is_bgzf(tmp_path):
+    """Ensure plain gzip and uncompressed files are not treated as BGZF."""
+    gzip_path = tmp_path / "plain.vcf.gz"
+    with gzip.open(gzip_path, "wt") as f:
+        f.write("##fileformat=VCFv4.2\n")
+    assert not is_bgzf(gzip_path)
+    assert not is_bgzf("tests/fixtures/1kGP.chr1.1000.slim.vcf")
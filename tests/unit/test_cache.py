@@ -0,0 +1,77 @@
+from diskcache import Cache, FanoutCache
+
+import vrs_anvil
+from vrs_anvil import (
+    MemoryCache,
+    TieredCache,
+    allele_translator_cache,
+    allele_translator_disk_cache,
+    bytes_in_a_gigabyte,
+    caching_allele_translator_factory,
+)
+
+
+def test_memory_cache_lru():
+    """Ensure the memory tier evicts the least recently used entry and counts it."""
+    cache = MemoryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1, "a should be cached"
+    cache.set("c", 3)  # evicts b, the least recently used
+
+    assert cache.get("b") is None, "b should have been evicted"
+    assert cache.get("c") == 3, "c should be cached"
+    assert cache.stats() == {"size": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_tiered_cache(tmp_path):
+    """Ensure disk hits are promoted into memory and counted per tier."""
+    disk = Cache(directory=str(tmp_path / "allele_translator"))
+    disk.set("1-10-A-T-gnomad", "ga4gh:VA.on-disk")
+    cache = TieredCache(disk, memory_size=10)
+
+    assert cache.get("1-10-A-T-gnomad") == "ga4gh:VA.on-disk", "disk tier hit"
+    assert cache.get("1-10-A-T-gnomad") == "ga4gh:VA.on-disk", "memory tier hit"
+    assert cache.get("1-20-G-C-gnomad") is None, "miss in both tiers"
+    cache.set("1-20-G-C-gnomad", "ga4gh:VA.new")
+    assert disk.get("1-20-G-C-gnomad") == "ga4gh:VA.new", "writes go through to disk"
+
+    stats = cache.stats()
+    assert stats["memory"]["hits"] == 1 and stats["memory"]["misses"] == 2
+    assert stats["disk"]["hits"] == 1 and stats["disk"]["misses"] == 1
+    assert stats["disk"]["writes"] == 1
+
+
+def test_translators_share_cache(testing_manifest, monkeypatch):
+    """Ensure translators in a process share one cache and hit it on repeats."""
+    testing_manifest.cache_enabled = True
+    monkeypatch.setattr(vrs_anvil, "manifest", testing_manifest)
+
+    first = caching_allele_translator_factory()
+    second = caching_allele_translator_factory()
+    assert first._cache is second._cache, "translators should share a cache"
+    assert first._cache is allele_translator_cache(testing_manifest)
+
+    allele_id = first.translate_from(fmt="gnomad", var="19-44908822-C-T")
+    assert second.translate_from(fmt="gnomad", var="19-44908822-C-T") == allele_id
+    assert first._cache.memory.hits >= 1, "repeat should be a memory hit"
+
+
+def test_disk_cache_from_manifest(testing_manifest):
+    """Ensure the disk tier follows the manifest's size, backend and eviction policy."""
+    testing_manifest.cache_size_gb = 2
+    testing_manifest.cache_eviction_policy = "least-recently-used"
+
+    disk = allele_translator_disk_cache(testing_manifest)
+    assert isinstance(disk, Cache), "default backend is a single Cache"
+    assert disk.size_limit == 2 * bytes_in_a_gigabyte
+    assert disk.eviction_policy == "least-recently-used"
+    disk.close()
+
+    testing_manifest.cache_backend = "fanout"
+    testing_manifest.cache_shards = 4
+    disk = allele_translator_disk_cache(testing_manifest)
+    assert isinstance(disk, FanoutCache), "fanout backend is sharded"
+    assert len(disk._shards) == 4, "should have one sqlite file per shard"
+    assert disk.size_limit == bytes_in_a_gigabyte / 2, "size is split across shards"
+    disk.close()
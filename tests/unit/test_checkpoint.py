@@ -0,0 +1,75 @@
+import pytest
+import yaml
+
+import vrs_anvil
+import vrs_anvil.annotator
+from vrs_anvil.annotator import SUCCESSES, TOTAL, annotate_all
+from vrs_anvil.checkpoint import ProgressTracker, checkpoint_path
+
+
+def test_progress_tracker():
+    """Ensure progress stops at the first line with items still being annotated."""
+    tracker = ProgressTracker()
+    tracker.read("a.vcf", 1, 2)
+    tracker.read("a.vcf", 2, 0)  # no valid alts
+    tracker.read("a.vcf", 3, 1)
+    tracker.read("a.vcf", 4, 1)
+    assert tracker.done("a.vcf", 3), "line 3 has a single item"
+    assert not tracker.done("a.vcf", 1), "line 1 has another item"
+    assert tracker.progress() == {"a.vcf": {"committed_line": 0, "done_lines": [2, 3]}}
+
+    tracker.done("a.vcf", 1)
+    assert tracker.committed_line("a.vcf") == 3
+    tracker.done("a.vcf", 4)
+    assert tracker.progress() == {"a.vcf": {"committed_line": 4, "done_lines": []}}
+
+
+@pytest.mark.parametrize("dying_call", [301, 302])
+def test_resume(testing_manifest, monkeypatch, dying_call):
+    """Ensure a resumed run skips committed lines and ends with the metrics of an uninterrupted run."""
+    testing_manifest.vcf_files = ["tests/fixtures/1kGP.chr1.1000.vrs.vcf.gz"]
+    testing_manifest.num_threads = 1
+    testing_manifest.limit = None
+    # two items per line, so the run dies after a whole line or part way through one
+    testing_manifest.compute_for_ref = True
+
+    def successes(metrics_file) -> int:
+        with open(metrics_file) as stream:
+            return yaml.safe_load(stream)[TOTAL][SUCCESSES]
+
+    expected = successes(annotate_all(testing_manifest, max_errors=1000))
+
+    # die part way through the file
+    get = vrs_anvil.MetaKBProxy.get
+    calls = []
+
+    def dying_get(self, allele_id):
+        calls.append(allele_id)
+        if len(calls) == dying_call:
+            raise RuntimeError("preempted")
+        return get(self, allele_id)
+
+    monkeypatch.setattr(vrs_anvil.MetaKBProxy, "get", dying_get)
+    with pytest.raises(RuntimeError):
+        annotate_all(testing_manifest, max_errors=1000)
+    assert checkpoint_path(
+        testing_manifest
+    ).exists(), "should checkpoint on the way out"
+    monkeypatch.setattr(vrs_anvil.MetaKBProxy, "get", get)
+
+    parsed_lines = []
+    generate_gnomad_ids = vrs_anvil.annotator.generate_gnomad_ids
+
+    def counting_generate_gnomad_ids(line, **kwargs):
+        parsed_lines.append(line)
+        return generate_gnomad_ids(line, **kwargs)
+
+    monkeypatch.setattr(
+        vrs_anvil.annotator, "generate_gnomad_ids", counting_generate_gnomad_ids
+    )
+    metrics_file = annotate_all(testing_manifest, max_errors=1000, resume=True)
+    assert successes(metrics_file) == expected, "should count every allele once"
+    assert 0 < len(parsed_lines) < 889, "should only parse lines after the checkpoint"
+    assert not checkpoint_path(
+        testing_manifest
+    ).exists(), "should remove the checkpoint"
@@ -1,12 +1,17 @@
+import gzip
 import os
 from pathlib import Path
 import shutil
+import time
+import pyarrow.parquet as pq
 import pytest
+import yaml
 
 from click.testing import CliRunner
 from glob import glob
 from unittest.mock import MagicMock, patch
-from vrs_anvil import Manifest
+from vrs_anvil import Manifest, allele_translator_disk_cache
+from vrs_anvil.annotator import SUCCESSES, TOTAL
 from vrs_anvil.cli import cli
 
 ############
@@ -120,13 +125,17 @@ def test_annotate_scatter(mock_cli_manifest):
     print("manifest", manifest)
     runner = CliRunner()
 
-    # stub the annotate_all function
+    # stub the child processes, each has exited when first polled
     mock = MagicMock()
+    mock.return_value.pid = 123
+    mock.return_value.poll.return_value = 0
 
     # run annotate scatter cmd
     with patch("vrs_anvil.cli.run_command_in_background", mock):
         result = runner.invoke(cli, "annotate --scatter")
     print(result.output)
+    assert "all processes completed" in result.output
+    assert mock.call_count == len(manifest.vcf_files)
 
     # make sure scattered processes and log files
     work_dir = str(Path(manifest.work_directory))
@@ -138,6 +147,22 @@ def test_annotate_scatter(mock_cli_manifest):
     assert num_log_files == 1, f"expected 1 log files, got {num_log_files}"
 
 
+def test_annotate_scatter_interrupted(mock_cli_manifest):
+    """Test that an interrupted scatter run is reported as such and not gathered"""
+
+    runner = CliRunner()
+    mock = MagicMock(side_effect=KeyboardInterrupt)
+    with patch("vrs_anvil.cli.run_scattered", mock):
+        result = runner.invoke(cli, "annotate --scatter")
+    print(result.output)
+    assert "interrupted" in result.output
+    assert "all processes completed" not in result.output
+    assert "merged metrics" not in result.output
+
+    state_dir = str(Path(mock_cli_manifest.state_directory))
+    assert not glob(f"{state_dir}/matches_*.parquet"), "should not gather"
+
+
 def test_ps_returns_recent_files(ps_dir, monkeypatch, recent_timestamp, num_vcfs):
     """Test that vrs_anvil ps returns the most recent scatter command"""
 
@@ -164,3 +189,104 @@ def test_ps_returns_recent_files(ps_dir, monkeypatch, recent_timestamp, num_vcfs
         assert (
             f"metrics_scattered_{recent_timestamp}_{i}.yaml" in result.output
         ), f"metrics file #{i} of {num_vcfs} not found"
+
+
+def test_ps_progress(ps_dir, tmp_path, monkeypatch, recent_timestamp):
+    """Test that vrs_anvil ps shows the progress snapshots of scattered processes"""
+    shutil.copytree(ps_dir, tmp_path / "ps")
+    shutil.copytree(Path(ps_dir).parent / "metakb", tmp_path / "metakb")
+    monkeypatch.chdir(tmp_path / "ps")
+    snapshot = {
+        "status": "running",
+        "elapsed_time": 60.0,
+        "lines": 1200,
+        "alleles": 1500,
+        "successes": 1490,
+        "errors": 10,
+        "metakb_hits": 2,
+        "lines_per_second": 20.0,
+        "alleles_per_second": 25.0,
+        "recent_alleles_per_second": 30.0,
+        "cache_hit_rate": {"memory": 0.5},
+        "queue_depths": {"tasks": 4, "results": 0},
+    }
+    with open(f"state/progress_scattered_{recent_timestamp}_0.yaml", "w") as stream:
+        yaml.dump(snapshot, stream)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, "--manifest manifest.yaml ps")
+    print(result.output)
+    assert result.exit_code == 0, f"result failed with message: \n{result}"
+    assert "lines: 1200 (20.0/s)" in result.output
+    assert "cache hit rate: memory 50%" in result.output
+    assert "tasks 4" in result.output
+
+
+def test_export_import_cache(mock_cli_manifest):
+    """Test that the allele translator cache round trips through export-cache and import-cache"""
+    manifest = mock_cli_manifest
+    cached = {
+        "1-20-G-C": "ga4gh:VA.second",
+        "1-10-A-T": "ga4gh:VA.first",
+    }
+    disk = allele_translator_disk_cache(manifest)
+    for gnomad_expression, vrs_id in cached.items():
+        disk.set(f"{gnomad_expression}-gnomad", vrs_id)
+    disk.close()
+
+    runner = CliRunner()
+    result = runner.invoke(cli, "export-cache cache.tsv.gz")
+    print(result.output)
+    assert "exported 2 VRS ids" in result.output, "should export every entry"
+    with gzip.open("cache.tsv.gz", "rt") as f:
+        assert f.read() == "1-10-A-T\tga4gh:VA.first\n1-20-G-C\tga4gh:VA.second\n"
+
+    shutil.rmtree(manifest.cache_directory)
+    result = runner.invoke(cli, "import-cache cache.tsv.gz")
+    print(result.output)
+    assert "imported 2 VRS ids" in result.output, "should import every entry"
+
+    disk = allele_translator_disk_cache(manifest)
+    for gnomad_expression, vrs_id in cached.items():
+        assert disk.get(f"{gnomad_expression}-gnomad") == vrs_id
+    disk.close()
+
+
+def test_gather(ps_dir, tmp_path, monkeypatch, recent_timestamp):
+    """Test that gather merges the metrics of the most recent scatter run"""
+    shutil.copytree(ps_dir, tmp_path / "ps")
+    shutil.copytree(Path(ps_dir).parent / "metakb", tmp_path / "metakb")
+    monkeypatch.chdir(tmp_path / "ps")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, "--manifest manifest.yaml gather")
+    print(result.output)
+    assert "gathering 2 metrics files" in result.output
+
+    with open(f"state/metrics_{recent_timestamp}.yaml") as stream:
+        metrics = yaml.safe_load(stream)
+    children = []
+    for i in range(2):
+        with open(f"state/metrics_scattered_{recent_timestamp}_{i}.yaml") as stream:
+            children.append(yaml.safe_load(stream))
+    assert metrics[TOTAL][SUCCESSES] == sum(_[TOTAL][SUCCESSES] for _ in children)
+    assert len(metrics) == 3, "should have a total and an entry per vcf"
+
+    matches = pq.read_table(f"state/matches_{recent_timestamp}.parquet")
+    assert matches.column_names == ["file", "vrs_id", "fmt", "var"]
+
+
+def test_profile(mock_cli_manifest, suffix):
+    """Ensure --profile writes a summary and collapsed stacks next to the log."""
+    mock = MagicMock()
+    mock.side_effect = lambda *args, **kwargs: time.sleep(0.2) or "metrics.yaml"
+    runner = CliRunner()
+    with patch("vrs_anvil.cli.annotate_all", mock):
+        result = runner.invoke(cli, f"--suffix {suffix} --profile annotate")
+    print(result.output)
+
+    state_dir = Path(mock_cli_manifest.state_directory)
+    summary_path = state_dir / f"profile_{suffix}.txt"
+    assert f"profile_{suffix}.txt" in result.output
+    assert "top 25 functions by self samples" in summary_path.read_text()
+    assert (state_dir / f"profile_{suffix}.folded").exists()
@@ -0,0 +1,91 @@
+from vrs_anvil.annotator import (
+    ELAPSED_TIME,
+    END_TIME,
+    ERRORS,
+    LINE_COUNT,
+    MATCHES,
+    PARAMETERS,
+    REGIONS,
+    START_TIME,
+    STATUS,
+    SUCCESSES,
+    TOTAL,
+    VRS_OBJECT,
+)
+from vrs_anvil.gather import matches_table, merge_metrics
+
+
+def _region_metrics(region: str, start: float, end: float, errors: dict) -> dict:
+    """Return the metrics a scattered child writes for one region of a vcf."""
+    return {
+        "work/chr1.vcf.gz": {
+            STATUS: "finished",
+            START_TIME: start,
+            END_TIME: end,
+            ELAPSED_TIME: end - start,
+            LINE_COUNT: 10,
+            SUCCESSES: 9,
+            ERRORS: errors,
+            MATCHES: {f"ga4gh:VA.{region}": {"fmt": "gnomad", "var": region}},
+            REGIONS: [region],
+        },
+        TOTAL: {START_TIME: start, END_TIME: end, SUCCESSES: 9, ERRORS: 1},
+    }
+
+
+def test_merge_metrics():
+    """Ensure per region metrics of a vcf add up to one entry."""
+    merged = merge_metrics(
+        [
+            _region_metrics("chr1:1-16384", 10, 20, {"ValueError": 1}),
+            _region_metrics("chr1:16385", 5, 30, {"ValueError": 1}),
+        ],
+        timestamp_str="20240101_000000",
+    )
+
+    metrics = merged["work/chr1.vcf.gz"]
+    assert metrics[STATUS] == "finished"
+    assert metrics[LINE_COUNT] == 20 and metrics[SUCCESSES] == 18
+    assert metrics[ERRORS] == {"ValueError": 2}
+    assert len(metrics[MATCHES]) == 2
+    assert metrics[REGIONS] == ["chr1:1-16384", "chr1:16385"]
+    assert (
+        metrics[ELAPSED_TIME] == 25
+    ), "should span the earliest start to the latest end"
+
+    assert merged[TOTAL][SUCCESSES] == 18 and merged[TOTAL][ERRORS] == 2
+    assert merged[TOTAL][ELAPSED_TIME] == 25
+
+
+def test_matches_table():
+    """Ensure matches of current and older metrics layouts become table rows."""
+    table = matches_table(
+        {
+            "work/chr1.vcf.gz": {
+                MATCHES: {"ga4gh:VA.a": {"fmt": "gnomad", "var": "chr1-10-A-T"}}
+            },
+            "work/chr2.vcf.gz": {
+                MATCHES: {
+                    "ga4gh:VA.b": {
+                        PARAMETERS: {"fmt": "gnomad", "var": "chr2-10-A-T"},
+                        VRS_OBJECT: {},
+                    }
+                }
+            },
+            TOTAL: {SUCCESSES: 2},
+        }
+    )
+    assert table.to_pylist() == [
+        {
+            "file": "work/chr1.vcf.gz",
+            "vrs_id": "ga4gh:VA.a",
+            "fmt": "gnomad",
+            "var": "chr1-10-A-T",
+        },
+        {
+            "file": "work/chr2.vcf.gz",
+            "vrs_id": "ga4gh:VA.b",
+            "fmt": "gnomad",
+            "var": "chr2-10-A-T",
+        },
+    ]
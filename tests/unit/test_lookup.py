@@ -0,0 +1,77 @@
+import pathlib
+
+import pytest
+from ga4gh.vrs import models as VRS
+from ga4gh.vrs.extras.translator import AlleleTranslator
+
+import vrs_anvil
+from vrs_anvil import caching_allele_translator_factory
+from vrs_anvil.lookup import VRSLookupTable, annotated_vcf_alleles, build_lookup_table
+
+
+@pytest.fixture
+def annotated_vcf() -> pathlib.Path:
+    """Return a path to a VRS annotated vcf."""
+    _ = pathlib.Path("tests/fixtures/1kGP.chr1.1000.vrs.vcf.gz")
+    assert _.exists()
+    return _
+
+
+@pytest.fixture
+def lookup_table_path(annotated_vcf, tmp_path) -> str:
+    """Return a path to a lookup table built from the annotated vcf."""
+    table_path = str(tmp_path / "vrs_lookup.npy")
+    build_lookup_table([str(annotated_vcf)], table_path)
+    return table_path
+
+
+def test_lookup_table(annotated_vcf, lookup_table_path):
+    """Ensure every annotated allele can be looked up by its gnomAD expression."""
+    alleles = dict(annotated_vcf_alleles(str(annotated_vcf)))
+    assert "chr1-10397-C-A" in alleles, "should include alt alleles"
+    assert "chr1-10397-C-C" in alleles, "should include the ref allele"
+
+    table = VRSLookupTable(lookup_table_path)
+    assert len(table) == len(alleles), "should hold one row per distinct allele"
+    for gnomad_expression, vrs_id in alleles.items():
+        assert table.get(gnomad_expression) == vrs_id, gnomad_expression
+
+    assert table.get("chr1-1-A-T") is None, "novel alleles should miss"
+    assert table.stats() == {"hits": len(alleles), "misses": 1}
+
+
+def test_translator_uses_lookup_table(testing_manifest, lookup_table_path, monkeypatch):
+    """Ensure lookup table hits skip the AlleleTranslator."""
+    testing_manifest.vrs_lookup_table = lookup_table_path
+    monkeypatch.setattr(vrs_anvil, "manifest", testing_manifest)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("AlleleTranslator should not be called on a hit")
+
+    tlr = caching_allele_translator_factory()
+    monkeypatch.setattr(AlleleTranslator, "translate_from", fail)
+
+    assert (
+        tlr.translate_from(fmt="gnomad", var="chr1-10397-C-A")
+        == "ga4gh:VA.KAQ1E7Utu6zDzmmCS0eZ57JSbPASU0nb"
+    )
+
+
+def test_lookup_table_not_normalized(testing_manifest, lookup_table_path, monkeypatch):
+    """Ensure the normalized ids of the lookup table are not mixed into an unnormalized run."""
+    testing_manifest.vrs_lookup_table = lookup_table_path
+    testing_manifest.cache_enabled = False
+    monkeypatch.setattr(vrs_anvil, "manifest", testing_manifest)
+    monkeypatch.setattr(
+        AlleleTranslator,
+        "translate_from",
+        lambda self, var, fmt=None, **kwargs: VRS.Allele.model_construct(
+            id="ga4gh:VA.unnormalized"
+        ),
+    )
+
+    tlr = caching_allele_translator_factory(normalize=False)
+    assert (
+        tlr.translate_from(fmt="gnomad", var="chr1-10397-C-A")
+        == "ga4gh:VA.unnormalized"
+    )
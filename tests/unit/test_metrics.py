@@ -0,0 +1,72 @@
+import pyarrow.parquet as pq
+import yaml
+
+from vrs_anvil.annotator import annotate_all
+from vrs_anvil.metrics import (
+    CACHE,
+    ERRORS,
+    MATCHES,
+    MATCHES_FILE,
+    METAKB_HITS,
+    STATUS,
+    SUCCESSES,
+    TOTAL,
+    FileMetrics,
+    RunMetrics,
+)
+
+
+def test_file_metrics():
+    """Ensure file metrics serialize to the keys of the metrics yaml and back."""
+    metrics = RunMetrics()
+    metrics["a.vcf"].start()
+    metrics["a.vcf"].successes += 2
+    metrics["a.vcf"].add_error("ValueError")
+    metrics["a.vcf"].add_error("ValueError")
+    metrics.add_match("a.vcf", "ga4gh:VA.1", "gnomad", "1-2-A-T")
+    metrics["a.vcf"].finish(10)
+
+    d = metrics.to_dict()["a.vcf"]
+    assert d[STATUS] == "finished"
+    assert d[SUCCESSES] == 2
+    assert d[ERRORS] == {"ValueError": 2}
+    assert d[METAKB_HITS] == 1
+    assert d[MATCHES] == {"ga4gh:VA.1": {"fmt": "gnomad", "var": "1-2-A-T"}}
+    assert "regions" not in d, "unset metrics should be left out"
+    assert FileMetrics.from_dict(d) == metrics["a.vcf"]
+
+
+def test_run_isolation(testing_manifest, tmp_path):
+    """Ensure each run starts from empty metrics and reports only its own cache counters."""
+    testing_manifest.cache_enabled = True
+    testing_manifest.cache_directory = str(tmp_path / "cache")
+
+    def load(metrics_file) -> dict:
+        with open(metrics_file) as stream:
+            return yaml.safe_load(stream)
+
+    first = load(annotate_all(testing_manifest, max_errors=1000, timestamp_str="1"))
+    second = load(annotate_all(testing_manifest, max_errors=1000, timestamp_str="2"))
+    for key in [SUCCESSES, ERRORS]:
+        assert first[TOTAL][key] == second[TOTAL][key]
+    assert first.keys() == second.keys()
+
+    def lookups(metrics) -> int:
+        memory = metrics[TOTAL][CACHE]["memory"]
+        return memory["hits"] + memory["misses"]
+
+    assert lookups(first) > 0
+    assert lookups(first) == lookups(second), "should not count the first run's"
+    assert second[TOTAL][CACHE]["memory"]["hits"] == lookups(second), "all cached"
+
+
+def test_spill_matches(testing_manifest):
+    """Ensure spilled matches are written to parquet rather than the metrics yaml."""
+    testing_manifest.spill_matches = True
+    with open(annotate_all(testing_manifest, max_errors=1000)) as stream:
+        metrics = yaml.safe_load(stream)
+
+    matches = pq.read_table(metrics[TOTAL][MATCHES_FILE])
+    files = {k: v for k, v in metrics.items() if k != TOTAL}
+    assert all(MATCHES not in _ for _ in files.values())
+    assert matches.num_rows == sum(_[METAKB_HITS] for _ in files.values())
@@ -0,0 +1,60 @@
+import pathlib
+import threading
+import time
+
+from vrs_anvil import profiler as vrs_profiler
+from vrs_anvil.profiler import SamplingProfiler
+from vrs_anvil.translator import process_translator
+from tests.unit.test_translator import gnomad_ids
+
+
+def busy_worker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_all_threads(tmp_path):
+    """Ensure functions running on threads other than the caller's are sampled."""
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_worker, args=(stop,), name="busy")
+    profiler = SamplingProfiler(interval=0.001).start()
+    thread.start()
+    time.sleep(0.3)
+    stop.set()
+    thread.join()
+    profiler.stop()
+
+    assert profiler.samples > 0
+    busy = [_ for _ in profiler.stacks if _.startswith("MainProcess/busy;")]
+    assert any(";busy_worker " in _ for _ in busy)
+    own, cumulative = profiler.top(1000)
+    assert any(_.startswith("busy_worker ") for _, count in cumulative)
+    assert not any("SamplingProfiler" in _ for _ in profiler.stacks)
+    assert vrs_profiler.active() is None, "should no longer be active"
+
+    summary_path = profiler.write(tmp_path, "test", 5)
+    assert "samples per thread" in summary_path.read_text()
+    folded = (tmp_path / "profile_test.folded").read_text().splitlines()
+    assert all(_.rsplit(" ", 1)[1].isdigit() for _ in folded)
+
+
+def test_process_workers():
+    """Ensure the stacks of process pool workers are merged into the parent's profile."""
+    gnomad_csv = pathlib.Path(
+        "tests/fixtures/gnomAD_v4.0.0_ENSG00000012048_2024_03_04_18_33_26.csv"
+    )
+    profiler = SamplingProfiler(interval=0.001).start()
+    assert vrs_profiler.active() is profiler
+    try:
+        results = list(
+            process_translator(gnomad_ids(gnomad_csv, limit=500), 2, batch_size=50)
+        )
+    finally:
+        profiler.stop()
+
+    assert len(results) == 500
+    workers = [_ for _ in profiler.stacks if not _.startswith("MainProcess/")]
+    assert workers, "should have samples from the worker processes"
+    assert all(
+        _.startswith("SpawnProcess-") and ";_process_worker " in _ for _ in workers
+    ), "should be labelled with the worker process"
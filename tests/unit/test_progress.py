@@ -0,0 +1,32 @@
+import yaml
+
+from vrs_anvil.annotator import ERRORS, SUCCESSES, TOTAL, annotate_all
+from vrs_anvil.progress import cache_hit_rates, format_progress, load_progress
+
+
+def test_cache_hit_rates():
+    """Ensure hit rates are given for tiers that have been looked up."""
+    stats = {
+        "memory": {"hits": 3, "misses": 1, "size": 3},
+        "disk": {"hits": 0, "misses": 0, "writes": 0},
+    }
+    assert cache_hit_rates(stats) == {"memory": 0.75}
+
+
+def test_progress_snapshots(testing_manifest):
+    """Ensure annotate_all leaves a final snapshot of its progress."""
+    testing_manifest.progress_interval = 0.001
+    metrics_file = annotate_all(
+        testing_manifest, max_errors=1000, timestamp_str="progress"
+    )
+    with open(metrics_file) as stream:
+        total = yaml.safe_load(stream)[TOTAL]
+
+    snapshot = load_progress(
+        f"{testing_manifest.state_directory}/progress_progress.yaml"
+    )
+    assert snapshot["status"] == "finished"
+    assert snapshot["lines"] > 0
+    assert snapshot["alleles"] == total[SUCCESSES] + total[ERRORS]
+    assert "tasks" in snapshot["queue_depths"], "should report the threaded queues"
+    assert f"alleles: {snapshot['alleles']}" in format_progress(snapshot)
@@ -0,0 +1,66 @@
+import gzip
+import random
+
+import pysam
+import pytest
+
+from vrs_anvil.annotator import _vcf_lines
+from vrs_anvil.regions import parse_region, split_regions
+
+
+def _indexed_vcf(tmp_path, csi: bool) -> str:
+    """Write a two contig vcf with some long deletions, bgzip and index it."""
+    vcf_path = tmp_path / "regions.vcf"
+    rng = random.Random(42)  # random ids, so bgzip makes many blocks
+    with open(vcf_path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        f.write(
+            "##contig=<ID=chr1,length=1000000>\n##contig=<ID=chr2,length=1000000>\n"
+        )
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for contig, stop in [("chr1", 600_000), ("chr2", 200_000)]:
+            for pos in range(1, stop, 20):
+                # deletions spanning 16kb tabix bins
+                ref = "A" * 500 if pos % 1000 == 1 else "A"
+                f.write(
+                    f"{contig}\t{pos}\trs{rng.randrange(10**9)}\t{ref}\tT\t.\tPASS\t.\n"
+                )
+    return pysam.tabix_index(str(vcf_path), preset="vcf", csi=csi, force=True)
+
+
+@pytest.mark.parametrize("csi", [False, True])
+def test_split_regions(testing_manifest, tmp_path, csi):
+    """Ensure region shards are balanced and read every record exactly once."""
+    vcf_path = _indexed_vcf(tmp_path, csi)
+    with gzip.open(vcf_path, "rt") as f:
+        expected = [_.rstrip("\n") for _ in f if not _.startswith("#")]
+
+    shards = split_regions(vcf_path, 4)
+    # htslib merges csi bins smaller than 64KB compressed, a file this small splits by contig
+    assert len(shards) == (2 if csi else 4)
+
+    lines = []
+    for shard in shards:
+        testing_manifest.regions = shard
+        shard_lines = list(_vcf_lines(vcf_path, testing_manifest))
+        if not csi:
+            assert len(shard_lines) == pytest.approx(len(expected) / 4, rel=0.2)
+        lines.extend(shard_lines)
+    assert sorted(lines) == sorted(expected), "each record should be read once"
+
+    testing_manifest.vcf_reader = "pysam"
+    testing_manifest.regions = shards[0]
+    assert len(list(_vcf_lines(vcf_path, testing_manifest))) == len(
+        list(
+            _vcf_lines(
+                vcf_path, testing_manifest.model_copy(update={"vcf_reader": "text"})
+            )
+        )
+    ), "readers should agree"
+
+
+def test_parse_region():
+    """Ensure contigs with colons and open ended regions parse."""
+    assert parse_region("chr1:1-16384") == ("chr1", 1, 16384)
+    assert parse_region("chr1:16385") == ("chr1", 16385, None)
+    assert parse_region("HLA-A*01:01:01:01:1-100") == ("HLA-A*01:01:01:01", 1, 100)
@@ -0,0 +1,80 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+import yaml
+
+from vrs_anvil.annotator import RESULTS, SUCCESSES, TOTAL, annotate_all
+from vrs_anvil.results import RESULTS_SCHEMA, ResultsSink
+from vrs_anvil.translator import VCFItem
+
+
+def _items() -> list[VCFItem]:
+    return [
+        VCFItem("gnomad", "chr1-10-A-T", "a.vcf", 1, result="ga4gh:VA.t"),
+        VCFItem("gnomad", "chr1-10-A-G", "a.vcf", 1, result="ga4gh:VA.g"),
+        VCFItem("gnomad", "chr1-20-C-N", "a.vcf", 2, error="ValueError"),
+    ]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_results_sink(tmp_path, fmt):
+    """Ensure rows are written in batches of batch_size and read back intact."""
+    path = tmp_path / f"results.{fmt}"
+    with ResultsSink(path, fmt, batch_size=2) as sink:
+        items = _items()
+        sink.write(items[0], metakb_hit=True)
+        sink.write(items[1])
+        sink.write(items[2])
+
+    if fmt == "parquet":
+        table = pq.read_table(path)
+        assert pq.ParquetFile(path).num_row_groups == 2
+    else:
+        with pa.ipc.open_file(path) as reader:
+            assert reader.num_record_batches == 2
+            table = reader.read_all()
+    assert table.schema == RESULTS_SCHEMA
+    assert table.to_pylist() == [
+        {
+            "file": "a.vcf",
+            "line_number": 1,
+            "var": "chr1-10-A-T",
+            "vrs_id": "ga4gh:VA.t",
+            "metakb_hit": True,
+            "error": None,
+        },
+        {
+            "file": "a.vcf",
+            "line_number": 1,
+            "var": "chr1-10-A-G",
+            "vrs_id": "ga4gh:VA.g",
+            "metakb_hit": False,
+            "error": None,
+        },
+        {
+            "file": "a.vcf",
+            "line_number": 2,
+            "var": "chr1-20-C-N",
+            "vrs_id": None,
+            "metakb_hit": False,
+            "error": "ValueError",
+        },
+    ]
+
+
+def test_annotate_results(testing_manifest):
+    """Ensure annotate_all writes a row for every translated allele."""
+    testing_manifest.results_format = "parquet"
+    testing_manifest.results_batch_size = 10
+
+    metrics_file = annotate_all(testing_manifest, max_errors=1000)
+    with open(metrics_file) as stream:
+        metrics = yaml.safe_load(stream)
+
+    table = pq.read_table(metrics[TOTAL][RESULTS])
+    assert table.num_rows > 0
+    successes = table.filter(pc.is_null(table["error"]))["file"].to_pylist()
+    assert len(set(successes)) == len(testing_manifest.vcf_files)
+    for file_name in set(successes):
+        assert successes.count(file_name) == metrics[file_name][SUCCESSES]
@@ -0,0 +1,80 @@
+import itertools
+
+import pytest
+
+import vrs_anvil.scatter
+from vrs_anvil.scatter import ScatterJob, job_size, run_scattered
+
+
+class FakeProcess:
+    """A child that exits on its second poll."""
+
+    pids = itertools.count(100)
+
+    def __init__(self):
+        self.pid = next(self.pids)
+        self.polls = 0
+        self.terminated = False
+
+    def poll(self):
+        self.polls += 1
+        return 0 if self.polls > 1 else None
+
+    def terminate(self):
+        self.terminated = True
+
+    def wait(self):
+        return 0
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(vrs_anvil.scatter, "POLL_INTERVAL", 0)
+
+
+def test_run_scattered():
+    """Ensure no more than max_processes children run at once and the largest jobs start first."""
+    jobs = [ScatterJob(f"job {size}", size) for size in [10, 30, 20, 40]]
+    started, running, snapshots = [], [], []
+
+    def start(command):
+        process = FakeProcess()
+        started.append(command)
+        running.append(process)
+        return process
+
+    def on_change():
+        snapshots.append([_.record["status"] for _ in jobs])
+        alive = [_ for _ in running if _.polls < 2]
+        assert len(alive) <= 2
+
+    run_scattered(jobs, 2, start, on_change)
+    assert started == ["job 40", "job 30", "job 20", "job 10"]
+    assert snapshots[0] == ["queued", "running", "queued", "running"]
+    assert all(_.record["status"] == "exited" for _ in jobs)
+    assert all(_.record["pid"] >= 100 for _ in jobs)
+
+
+def test_run_scattered_interrupted():
+    """Ensure an interrupt terminates the running children and leaves the rest queued."""
+    jobs = [ScatterJob(f"job {size}", size) for size in [10, 20, 30]]
+
+    interrupts = [KeyboardInterrupt()]
+
+    def on_change():
+        if interrupts:
+            raise interrupts.pop()
+
+    with pytest.raises(KeyboardInterrupt):
+        run_scattered(jobs, 1, lambda _: FakeProcess(), on_change)
+    assert [_.record["status"] for _ in jobs] == ["queued", "queued", "terminated"]
+    assert jobs[2].process.terminated
+
+
+def test_job_size(tmp_path):
+    """Ensure a region shard's size is its share of the file."""
+    vcf = tmp_path / "a.vcf.gz"
+    vcf.write_bytes(b"0" * 100)
+    assert job_size(str(vcf)) == 100
+    assert job_size(str(vcf), 4) == 25
+    assert job_size("gs://bucket/b.vcf.gz") == 0
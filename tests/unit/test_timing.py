@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+import yaml
+
+import vrs_anvil.autotune
+from vrs_anvil import TimedSeqRepoDataProxy, timing
+from vrs_anvil.annotator import SUCCESSES, TIMING, TOTAL, annotate_all
+
+
+@pytest.fixture
+def timing_on():
+    timing.enable()
+    timing.reset()
+    yield
+    timing.enable(False)
+    timing.reset()
+
+
+def test_disabled():
+    """Ensure nothing is recorded while timing is off."""
+    timing.reset()
+    started = timing.start()
+    timing.stop("stage", started)
+    assert started == 0.0
+    assert timing.snapshot() == {}
+
+
+def test_workers(timing_on):
+    """Ensure each thread's calls are totalled separately."""
+
+    def work():
+        for _ in range(3):
+            timing.stop("stage", timing.start())
+
+    thread = threading.Thread(target=work, name="worker")
+    thread.start()
+    thread.join()
+    work()
+    assert list(timing.timed_iter(range(2), "read")) == [0, 1]
+
+    summary = timing.summarize(timing.snapshot())
+    assert summary["stage"]["calls"] == 6
+    assert summary["stage"]["workers"]["MainProcess/worker"]["calls"] == 3
+    assert summary["read"]["calls"] == 2
+
+    merged = timing.merge_summaries([summary, summary])
+    assert merged["stage"]["calls"] == 12
+
+    timing.reset()
+    work()
+    assert timing.snapshot()["MainProcess/MainThread"]["stage"]["calls"] == 3
+
+
+def test_seqrepo(timing_on):
+    """Ensure seqrepo reads are timed as a stage of their own."""
+
+    class FakeSeqRepo:
+        def fetch_uri(self, identifier, start, end):
+            return "ACGT"[start:end]
+
+    data_proxy = TimedSeqRepoDataProxy(FakeSeqRepo())
+    assert data_proxy.get_sequence("refseq:NC_000001.11", 1, 3) == "CG"
+    assert timing.summarize(timing.snapshot())["seqrepo"]["calls"] == 1
+
+
+def test_annotate_timing(testing_manifest):
+    """Ensure annotate_all reports the stages of the pipeline."""
+    testing_manifest.timing = True
+    with open(annotate_all(testing_manifest, max_errors=1000)) as stream:
+        stages = yaml.safe_load(stream)[TOTAL][TIMING]
+    timing.enable(False)
+
+    for stage in ["read_vcf", "generate_gnomad_ids", "translate", "metakb_get"]:
+        assert stages[stage]["calls"] > 0, f"{stage} should be timed"
+    assert stages["translate"]["calls"] == sum(
+        _["calls"] for _ in stages["translate"]["workers"].values()
+    )
+
+
+def test_annotate_timing_autotune(testing_manifest, monkeypatch):
+    """Ensure the workers of a process pool calibrated by autotune are left out of the run's timings."""
+    measure = vrs_anvil.autotune.measure
+
+    def thread_wins(items, mode, *args, **kwargs):
+        rate = measure(items, mode, *args, **kwargs)
+        return rate if mode == "thread" else 0.0
+
+    monkeypatch.setattr(
+        vrs_anvil.autotune,
+        "candidates",
+        lambda cpus: [("thread", 1, 1), ("process", 2, 1)],
+    )
+    monkeypatch.setattr(vrs_anvil.autotune, "measure", thread_wins)
+    testing_manifest.autotune = True
+    testing_manifest.cache_enabled = False
+    testing_manifest.timing = True
+    with open(annotate_all(testing_manifest, max_errors=1000)) as stream:
+        total = yaml.safe_load(stream)[TOTAL]
+    timing.enable(False)
+
+    assert testing_manifest.translation_mode == "thread"
+    assert total[TIMING]["translate"]["calls"] == total[SUCCESSES]
+    assert not any(
+        worker.startswith("SpawnProcess")
+        for stage in total[TIMING].values()
+        for worker in stage["workers"]
+    ), "calibration workers should not be reported"
@@ -1,10 +1,21 @@
 import logging
 import pathlib
+import queue
+import threading
+import time
 from typing import Generator
 
 import pytest
 
-from vrs_anvil.translator import threaded_translator, VCFItem
+import vrs_anvil
+import vrs_anvil.translator
+from vrs_anvil.translator import (
+    threaded_translator,
+    process_translator,
+    deduplicating_translator,
+    Translator,
+    VCFItem,
+)
 
 _logger = logging.getLogger("vrs_anvil.test_translator")
 
@@ -59,3 +70,227 @@ def test_threaded_translator(gnomad_csv):
 
     if limit:
         assert c == limit, "did not get the expected number of results"
+
+
+def test_threaded_translator_batched(gnomad_csv):
+    """Ensure batched work units return every item exactly once."""
+
+    limit = 2000
+    num_worker_threads = 4
+
+    generator_example = gnomad_ids(gnomad_csv, limit=limit)
+
+    results = threaded_translator(generator_example, num_worker_threads, batch_size=64)
+
+    line_numbers = []
+    for _ in results:
+        assert isinstance(_, VCFItem), "should get a VRS id"
+        assert _.result is not None, "allele.id is None"
+        line_numbers.append(_.line_number)
+
+    assert sorted(line_numbers) == list(
+        range(limit)
+    ), "did not get the expected results"
+
+
+def test_threaded_translator_preserve_order(gnomad_csv):
+    """Ensure ordered mode yields results in input order."""
+
+    limit = 2000
+    num_worker_threads = 8
+
+    generator_example = gnomad_ids(gnomad_csv, limit=limit)
+
+    results = threaded_translator(
+        generator_example,
+        num_worker_threads,
+        batch_size=16,
+        preserve_order=True,
+        reorder_window=4,
+    )
+
+    line_numbers = [_.line_number for _ in results]
+    assert line_numbers == list(range(limit)), "results should be in input order"
+
+
+def test_threaded_translator_reader_error(gnomad_csv):
+    """Ensure a failing reader ends the run with its error rather than silently truncating."""
+
+    def failing_generator():
+        yield from gnomad_ids(gnomad_csv, limit=10)
+        raise IOError("truncated input")
+
+    results = []
+    with pytest.raises(IOError, match="truncated input"):
+        for _ in threaded_translator(failing_generator(), 4):
+            results.append(_)
+
+    assert len(results) == 10, "results read before the error should be returned"
+
+
+def test_threaded_translator_item_errors(gnomad_csv):
+    """Ensure a bad allele is returned as an error and the workers keep going."""
+
+    def generator_with_bad_allele():
+        yield VCFItem("gnomad", "BAD-gnomad-expression", "test", -1)
+        yield from gnomad_ids(gnomad_csv, limit=100)
+
+    results = list(threaded_translator(generator_with_bad_allele(), 2))
+
+    assert len(results) == 101, "every item should be returned"
+    errors = [_ for _ in results if _.error]
+    assert len(errors) == 1, "only the bad allele should fail"
+    assert errors[0].error == "ValueError", "error should hold the exception class"
+    assert errors[0].result is None, "failed item should not have a result"
+
+
+def test_threaded_translator_respawns_workers(gnomad_csv, monkeypatch):
+    """Ensure a worker that dies hands back its batch as errors and is replaced."""
+
+    translate_item = vrs_anvil.translator._translate_item
+
+    def crashing_translate_item(tlr, item):
+        if item.line_number == 3:
+            raise RuntimeError("worker crashed")
+        return translate_item(tlr, item)
+
+    monkeypatch.setattr(
+        vrs_anvil.translator, "_translate_item", crashing_translate_item
+    )
+
+    results = list(threaded_translator(gnomad_ids(gnomad_csv, limit=100), 2))
+
+    assert len(results) == 100, "every item should be returned"
+    errors = [_ for _ in results if _.error]
+    assert [_.line_number for _ in errors] == [3], "only the crashed batch fails"
+    assert errors[0].error == "RuntimeError", "error should hold the exception class"
+
+
+def test_process_translator(gnomad_csv):
+    """Ensure the process pool works as expected and preserves input order."""
+
+    limit = 2000
+    num_worker_processes = 4
+
+    generator_example = gnomad_ids(gnomad_csv, limit=limit)
+
+    results = process_translator(
+        generator_example, num_worker_processes, batch_size=100
+    )
+
+    c = 0
+    for _ in results:
+        assert isinstance(_, VCFItem), "should get a VRS id"
+        assert _.result is not None, "allele.id is None"
+        assert _.line_number == c, "results should be in input order"
+        c += 1
+
+    assert c == limit, "did not get the expected number of results"
+
+
+def test_process_translator_threads(gnomad_csv):
+    """Ensure worker processes translating with several threads preserve input order."""
+
+    limit = 500
+    results = list(
+        process_translator(
+            gnomad_ids(gnomad_csv, limit=limit), 2, batch_size=50, threads_per_process=3
+        )
+    )
+
+    assert [_.line_number for _ in results] == list(range(limit))
+    assert all(_.result for _ in results), "allele.id is None"
+
+
+def test_process_translator_init_error(gnomad_csv, testing_manifest, monkeypatch):
+    """Ensure a worker process failing to start raises its own exception rather than BrokenProcessPool."""
+    testing_manifest.vrs_lookup_table = (
+        str(testing_manifest.work_directory) + "/missing.npy"
+    )
+    monkeypatch.setattr(vrs_anvil, "manifest", testing_manifest)
+
+    with pytest.raises(FileNotFoundError, match="missing.npy"):
+        list(process_translator(gnomad_ids(gnomad_csv, limit=10), 2))
+
+
+def test_deduplicating_translator():
+    """Ensure each distinct var is translated once and fanned out to every item."""
+
+    translated_vars = []
+
+    def counting_translate_from(generator):
+        for item in generator:
+            translated_vars.append(item.var)
+            yield item._replace(result=f"ga4gh:VA.{item.var}")
+
+    variants = ["1-10-A-T", "1-20-G-C", "1-10-A-T", "1-30-C-G", "1-20-G-C"]
+    items = [
+        VCFItem("gnomad", var, file_name, line_number)
+        for file_name in ["a.vcf", "b.vcf"]
+        for line_number, var in enumerate(variants)
+    ]
+
+    results = list(deduplicating_translator(iter(items), counting_translate_from))
+
+    assert sorted(translated_vars) == sorted(set(variants)), "should translate once"
+    assert sorted(results) == sorted(
+        _._replace(result=f"ga4gh:VA.{_.var}") for _ in items
+    ), "every item should get the result of its var"
+
+
+def test_deduplicating_translator_backpressure():
+    """Ensure duplicates do not let the reader run ahead of the caller."""
+
+    read = []
+
+    def repeated_items():
+        for line_number in range(100_000):
+            read.append(line_number)
+            yield VCFItem("gnomad", f"1-{line_number % 1000}-A-T", "a.vcf", line_number)
+
+    class FakeTranslator:
+        def translate_from(self, fmt, var):
+            return f"ga4gh:VA.{var}"
+
+    def pipelined_translate_from(generator):
+        # a reader thread feeding a bounded queue, like threaded_translator
+        tasks = queue.Queue(maxsize=10)
+
+        def reader():
+            for item in generator:
+                tasks.put(item)
+            tasks.put(None)
+
+        threading.Thread(target=reader, daemon=True).start()
+        while (item := tasks.get()) is not None:
+            yield vrs_anvil.translator._translate_item(FakeTranslator(), item)
+
+    results = deduplicating_translator(
+        repeated_items(), pipelined_translate_from, max_held=100
+    )
+    for _ in range(2000):
+        assert next(results).result
+    # give the reader a chance to run ahead
+    time.sleep(0.5)
+    assert len(read) < 5000, "the reader should be held to the caller's pace"
+
+    results = list(results)
+    assert len(results) == 100_000 - 2000, "every item should be returned"
+    assert all(_.result == f"ga4gh:VA.{_.var}" for _ in results)
+
+
+def test_threaded_translator_deduplicate(gnomad_csv):
+    """Ensure a deduplicating threaded run returns every item of overlapping inputs."""
+
+    limit = 500
+
+    def overlapping_files():
+        for file_name in ["a.vcf", "b.vcf"]:
+            for item in gnomad_ids(gnomad_csv, limit=limit):
+                yield item._replace(file_name=file_name)
+
+    tlr = Translator(deduplicate=True, batch_size=10)
+    results = list(tlr.translate_from(overlapping_files(), num_threads=4))
+
+    assert len(results) == 2 * limit, "every item should be returned"
+    assert all(_.result for _ in results), "every item should have a result"
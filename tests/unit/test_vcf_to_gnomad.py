@@ -19,3 +19,17 @@ def test_generate_gnomad_ids(caching_translator):
                     errors.append((gnomad_id, e))
     print(errors)
     assert len(results) >= 12, f"Errors: {len(errors)} Successes: {len(results)}"
+
+
+def test_generate_gnomad_ids_fields():
+    """Only CHROM, POS, REF and ALT are used, symbolic alts are skipped."""
+    genotypes = "\t".join(["0|1"] * 3202)
+    line = f"chr1\t10397\t.\tC\tA,<DEL>,CCCCTAA,*\t.\tPASS\tAC=1\tGT\t{genotypes}\n"
+    assert generate_gnomad_ids(line, compute_for_ref=False) == [
+        "chr1-10397-C-A",
+        "chr1-10397-C-CCCCTAA",
+    ]
+    assert generate_gnomad_ids(line)[0] == "chr1-10397-C-C", "ref should be first"
+
+    sites_only = "chr1\t10397\t.\tC\tA\n"
+    assert generate_gnomad_ids(sites_only, compute_for_ref=False) == ["chr1-10397-C-A"]
@@ -0,0 +1,94 @@
+import gzip
+import os
+
+import pysam
+
+from vrs_anvil.annotator import ANNOTATED_VCF, annotate_all
+from vrs_anvil.translator import VCFItem
+from vrs_anvil.vcf_writer import AnnotatedVCFWriter
+
+HEADER = [
+    "##fileformat=VCFv4.2\n",
+    "##contig=<ID=chr1>\n",
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n",
+]
+LINES = [
+    "chr1\t10\t.\tA\tT,<DEL>\t.\tPASS\tAC=1\n",
+    "chr1\t20\t.\tG\t*\t.\tPASS\t.\n",  # nothing to translate
+    "chr1\t30\t.\tC\tG\t.\tPASS\t.\n",
+]
+
+
+def test_writer_order(tmp_path):
+    """Ensure lines are written in input order whatever order their translations arrive in."""
+    output_path = tmp_path / "in.vrs.vcf.gz"
+    writer = AnnotatedVCFWriter(compute_for_ref=True)
+    writer.start("in.vcf", HEADER, output_path)
+    writer.read("in.vcf", 1, LINES[0], 2)
+    writer.read("in.vcf", 2, LINES[1], 0)
+    writer.read("in.vcf", 3, LINES[2], 2)
+    writer.finish("in.vcf")
+
+    def item(line_number, var, **kwargs) -> VCFItem:
+        return VCFItem("gnomad", var, "in.vcf", line_number, **kwargs)
+
+    writer.done(item(3, "chr1-30-C-G", error="ValueError"))
+    writer.done(item(3, "chr1-30-C-C", result="ga4gh:VA.c"))
+    writer.done(item(1, "chr1-10-A-T", result="ga4gh:VA.t"))
+    assert not os.path.exists(f"{output_path}.tbi"), "line 1 is still pending"
+    writer.done(item(1, "chr1-10-A-A", result="ga4gh:VA.a"))
+
+    with gzip.open(output_path, "rt") as f:
+        lines = [_ for _ in f if not _.startswith("##")]
+    assert lines == [
+        HEADER[-1],
+        "chr1\t10\t.\tA\tT,<DEL>\t.\tPASS\tAC=1;VRS_Allele_IDs=ga4gh:VA.a,ga4gh:VA.t,.\n",
+        LINES[1],
+        "chr1\t30\t.\tC\tG\t.\tPASS\tVRS_Allele_IDs=ga4gh:VA.c,.;VRS_Error=ValueError\n",
+    ]
+    assert os.path.exists(f"{output_path}.tbi"), "should be indexed once complete"
+
+
+def test_writer_short_record(tmp_path):
+    """Ensure a record without the QUAL, FILTER and INFO columns is padded with "." rather than failing."""
+    output_path = tmp_path / "in.vrs.vcf.gz"
+    writer = AnnotatedVCFWriter(compute_for_ref=False)
+    writer.start("in.vcf", HEADER, output_path)
+    writer.read("in.vcf", 1, "chr1\t10\t.\tA\tT\n", 1)
+    writer.finish("in.vcf")
+    writer.done(VCFItem("gnomad", "chr1-10-A-T", "in.vcf", 1, result="ga4gh:VA.t"))
+
+    with gzip.open(output_path, "rt") as f:
+        lines = [_ for _ in f if not _.startswith("#")]
+    assert lines == ["chr1\t10\t.\tA\tT\t.\t.\tVRS_Allele_IDs=ga4gh:VA.t\n"]
+
+
+def test_annotate_vcfs(testing_manifest):
+    """Ensure annotate_all writes an annotated copy of each vcf from a threaded run."""
+    vcf_path = "tests/fixtures/1kGP.chr1.1000.vrs.vcf.gz"
+    testing_manifest.vcf_files = [vcf_path]
+    testing_manifest.annotate_vcfs = True
+    testing_manifest.limit = None
+    testing_manifest.num_threads = 4
+    testing_manifest.batch_size = 10
+
+    metrics_file = annotate_all(testing_manifest, max_errors=1000)
+    with open(metrics_file) as stream:
+        metrics = stream.read()
+    output_path = os.path.join(
+        testing_manifest.work_directory, "1kGP.chr1.1000.vrs.vrs.vcf.gz"
+    )
+    assert f"{ANNOTATED_VCF}: {output_path}" in metrics
+
+    with pysam.VariantFile(vcf_path) as expected, pysam.VariantFile(output_path) as vcf:
+        assert vcf.header.info["VRS_Allele_IDs"].number == "A"
+        records = list(zip(expected, vcf))
+        assert len(records) == 889, "should write every record"
+        for expected_record, record in records:
+            assert (record.pos, record.alts) == (
+                expected_record.pos,
+                expected_record.alts,
+            )
+            assert len(record.info["VRS_Allele_IDs"]) == len(record.alts)
+            assert len(record.samples) == len(expected_record.samples)
+    assert os.path.exists(f"{output_path}.tbi")